@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Adaptive sampling of coupler curves.
+The example scripts step the crank at a fixed numsteps, which wastes
+solves where the coupler point moves slowly and misses detail where
+it is fast (like the top of the step in Jansen-lite.py).
+adaptivesample() starts from a coarse, even set of crank angles and
+keeps halving only those intervals where the curve of the chosen
+point(s) is not yet followed closely enough:
+* chordtol: the point at the middle angle is further than chordtol
+  from the middle of the straight chord between the interval ends,
+* angletol: the curve turns by more than angletol (radians) across
+  the interval.
+Each pass solves all the new middle angles with one solve_plan()
+call. Intervals that step in or out of assemblable positions are
+also refined, which locates where assembly is lost.
+
+Example:
+    mech = jansenlite()
+    thetas, joints, valid = adaptivesample(compile_mechanism(mech),
+                                           1.4,1.4+2*np.pi,'foot',0.05)
+gives the foot path with far fewer solves than even sampling at the
+same tolerance.
+"""
+
+import numpy as np
+
+from Mechanism import solve_plan
+
+#########################
+# plan from compile_mechanism(). points is a joint name or a list of
+# names whose curves must meet the tolerances. The angles start as
+# initialsteps even steps from thetastart to thetaend, and at most
+# maxpasses halvings are done, stopping early once there are more
+# than maxsteps angles.
+# branch is as for solve_plan(); with 'track' every pass re-solves
+# the merged angles in order so the branches stay continuous.
+# Returns thetas (increasing or decreasing like the input range),
+# joints (dict of name -> Nx2 arrays) and valid, as solve_plan().
+def adaptivesample(plan,thetastart,thetaend,points,chordtol,
+                   angletol=np.radians(10.),initialsteps=16,maxpasses=20,
+                   maxsteps=1000000,branch='fixed'):
+    if isinstance(points,str):
+        points = [points]
+    thetas = np.linspace(thetastart,thetaend,initialsteps)
+    joints, valid = solve_plan(plan,thetas,branch)
+    active = np.ones(initialsteps-1,bool)
+
+    for npass in range(maxpasses):
+        intervals = np.flatnonzero(active)
+        if intervals.size == 0 or thetas.shape[0] >= maxsteps:
+            break
+        mids = 0.5*(thetas[intervals]+thetas[intervals+1])
+        if branch == 'track':
+            merged = np.insert(thetas,intervals+1,mids)
+            alljoints, allvalid = solve_plan(plan,merged,branch)
+            new = intervals+1+np.arange(intervals.size)
+            midjoints = dict((name,alljoints[name][new]) for name in alljoints)
+            midvalid = allvalid[new]
+        else:
+            midjoints, midvalid = solve_plan(plan,mids,branch)
+
+        refine = _needsrefining(joints,midjoints,points,intervals,
+                                chordtol,angletol)
+        #Intervals with assembly at one end only: find the boundary
+        refine |= valid[intervals] != valid[intervals+1]
+
+        if branch == 'track':
+            joints, valid, thetas = alljoints, allvalid, merged
+        else:
+            thetas = np.insert(thetas,intervals+1,mids)
+            valid = np.insert(valid,intervals+1,midvalid)
+            joints = dict((name,np.insert(joints[name],intervals+1,
+                                          midjoints[name],axis=0))
+                          for name in joints)
+
+        #Each evaluated interval became two, which stay active only
+        #if the interval failed the tolerances
+        flags = np.zeros(active.shape[0],bool)
+        flags[intervals] = refine
+        counts = np.ones(active.shape[0],int)
+        counts[intervals] = 2
+        active = np.repeat(flags,counts)
+
+    return thetas, joints, valid
+
+# True for each interval whose middle point is off the chord by more
+# than chordtol, or where the curve turns by more than angletol.
+def _needsrefining(joints,midjoints,points,intervals,chordtol,angletol):
+    refine = np.zeros(intervals.shape[0],bool)
+    for name in points:
+        a = joints[name][intervals]
+        b = joints[name][intervals+1]
+        m = midjoints[name]
+        deviation = np.hypot(*(m-0.5*(a+b)).T)
+        v1 = m-a
+        v2 = b-m
+        cross = v1[:,0]*v2[:,1]-v1[:,1]*v2[:,0]
+        dot = v1[:,0]*v2[:,0]+v1[:,1]*v2[:,1]
+        turn = np.abs(np.arctan2(cross,dot))
+        with np.errstate(invalid='ignore'):
+            refine |= (deviation > chordtol) | (turn > angletol)
+    return refine
@@ -15,9 +15,9 @@ def arcpoints(cpoint,radius,thetastart,thetaend,numsteps):
     thetas = np.linspace(thetastart,thetaend,numsteps)
     plotpts = np.zeros((numsteps,2),float)          #array for the output
     
-    for i in range(0,numsteps):
-        plotpts[i,0] = cpoint[0] + radius*np.cos(thetas[i])
-        plotpts[i,1] = cpoint[1] + radius*np.sin(thetas[i])
+    #Fill whole columns at once rather than looping over thetas
+    plotpts[:,0] = cpoint[0] + radius*np.cos(thetas)
+    plotpts[:,1] = cpoint[1] + radius*np.sin(thetas)
 
     return plotpts
 #########################
\ No newline at end of file
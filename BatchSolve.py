@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Solve many variants of a mechanism at once: every initial joints
+file in a directory (or matching a glob) is built as the chosen
+example mechanism (see MechanismExamples.py), or read as a
+.linkage2 file, solved across a process pool and written out, with
+an index of the results.
+Each worker process imports the solver once and then handles many
+files, so throughput grows with the number of cores. A file that
+can't be read or built, or a design that can't be assembled,
+is recorded in the index and the batch carries on.
+Contents:
+* expandinputs(): The joint files named by directories and globs.
+* outputnames(): Output names from the paths relative to the
+  common directory of all inputs.
+* solvefile(): Solve one file and write its trajectory (worker).
+* runbatch(): Solve a list of files over a pool, generating
+  one summary record per file as they finish.
+* writeindex(): Write the summary records to index.json.
+
+Usage:
+  python BatchSolve.py geared5bar Variants/ -o Results [-j 8]
+  python BatchSolve.py klann 'Klann*/InitialJoints*.txt' -o Results \\
+      --numsteps 720 --format txt
+  python BatchSolve.py linkage2 Designs/ -o Results
+Output files are Results/<path>.npz (or .txt, or a directory of
+.npy columns, see TrajectoryIO.py), <path> being the input file
+without its extension, relative to the directory holding all the
+inputs (so Klann1/InitialJointsKlann.txt and
+Klann2/InitialJointsKlann.txt go to Results/Klann1/... and
+Results/Klann2/...), plus Results/index.json with one record per
+input file:
+  file, output, status ('ok', 'partial' if some steps can't be
+  assembled, 'unassemblable', 'failed', also when two inputs would
+  write the same output), error, numsteps,
+  numvalid, seconds, and the bounding box and path length of the
+  mechanism's last joint (coupler point or foot).
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+
+from Mechanism import compile_mechanism, solve_plan, inputperiod
+from MechanismExamples import EXAMPLEFILES, buildexample, scriptthetas
+from Linkage2Import import loadlinkage2
+from TrajectoryIO import mechanismmetadata, savetrajectory
+from TrajectoryMetrics import PathMetrics
+
+INDEXFILE = 'index.json'
+EXTENSIONS = {'npz':'.npz','txt':'.txt','columns':''}
+
+#########################
+# Expand directories (every file matching pattern in them) and
+# glob patterns into a sorted list of files.
+def expandinputs(paths,pattern='*.txt'):
+    filenames = set()
+    for path in paths:
+        if os.path.isdir(path):
+            filenames.update(glob.glob(os.path.join(path,pattern)))
+        else:
+            filenames.update(glob.glob(path))
+    return sorted(filenames)
+
+# Output name of each file (without extension): its path relative
+# to the common directory of all files
+def outputnames(filenames):
+    paths = [os.path.abspath(filename) for filename in filenames]
+    if not paths:
+        return []
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return [os.path.splitext(os.path.relpath(path,root))[0] for path in paths]
+
+# Build the mechanism of one input file
+def _build(mechanism,filename,gearratio):
+    if mechanism == 'linkage2':
+        return loadlinkage2(filename)
+    return buildexample(mechanism,filename,gearratio)
+
+# Input angles: the script's own unless numsteps or thetarange is
+# given (then from mech.theta0; .linkage2 designs default to 60
+# steps over one period).
+def _thetas(mechanism,mech,plan,numsteps,thetarange):
+    if mechanism != 'linkage2' and numsteps is None and thetarange is None:
+        return scriptthetas(mechanism,mech.theta0)
+    if thetarange is None:
+        thetarange = inputperiod(plan) or 2*np.pi
+    return np.linspace(mech.theta0,mech.theta0+thetarange,numsteps or 60)
+
+#########################
+# Solve one joints file and write its trajectory into outdir, as
+# name (default the file's name without extension; it may include
+# subdirectories). Returns the summary record for the index; errors
+# are recorded there rather than raised, so one bad file can't stop
+# a batch.
+def solvefile(filename,mechanism,outdir,numsteps=None,thetarange=None,
+              gearratio=-2.0,branch='fixed',fmt='npz',name=None):
+    record = {'file':filename,'output':None,'status':'failed','error':None,
+              'numsteps':0,'numvalid':0}
+    tstart = time.time()
+    try:
+        mech = _build(mechanism,filename,gearratio)
+        plan = compile_mechanism(mech)
+        thetas = _thetas(mechanism,mech,plan,numsteps,thetarange)
+        joints, valid = solve_plan(plan,thetas,branch)
+
+        last = plan[-1][1]
+        metrics = PathMetrics([last])
+        metrics(0,thetas,joints,valid)
+        record['numsteps'] = metrics.numsteps
+        record['numvalid'] = metrics.numvalid
+        if last in metrics.bbox:
+            record['joint'] = last
+            record['bbox'] = [float(x) for x in metrics.bbox[last]]
+            record['pathlength'] = float(metrics.pathlength[last])
+
+        if name is None:
+            name = os.path.splitext(os.path.basename(filename))[0]
+        output = os.path.join(outdir,name+EXTENSIONS[fmt])
+        if not os.path.isdir(os.path.dirname(output)):
+            os.makedirs(os.path.dirname(output))
+        columns = dict(joints,thetas=thetas,valid=valid)
+        savetrajectory(output,columns,mechanismmetadata(mech,source=filename),
+                       [stage[1] for stage in plan if stage[0] != 'ground'])
+        record['output'] = output
+        if valid.all():
+            record['status'] = 'ok'
+        elif valid.any():
+            record['status'] = 'partial'
+        else:
+            record['status'] = 'unassemblable'
+    except Exception as error:
+        record['error'] = '%s: %s' % (type(error).__name__,error)
+    record['seconds'] = time.time()-tstart
+    return record
+
+# solvefile() of a (filename, name) pair, for Pool.imap_unordered()
+def _solvenamed(item,**options):
+    return solvefile(item[0],name=item[1],**options)
+
+#########################
+# Solve every file over a pool of processes (default one per core;
+# processes=1 solves in this process). Generates the summary record
+# of each file as it finishes, in no particular order. Outputs are
+# named by outputnames(); a file whose output name is already taken
+# by another (same path but different extension, or the same file
+# listed twice) is not solved but recorded as failed. Other keywords
+# are passed to solvefile().
+def runbatch(filenames,mechanism,outdir,processes=None,**options):
+    if mechanism != 'linkage2' and not EXAMPLEFILES.get(mechanism):
+        raise ValueError('mechanism must be linkage2 or one of %s'
+                         % ', '.join(name for name in sorted(EXAMPLEFILES)
+                                     if EXAMPLEFILES[name]))
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    items = []
+    owners = {}
+    for filename, name in zip(filenames,outputnames(filenames)):
+        key = os.path.normcase(name)
+        if key in owners:
+            yield {'file':filename,'output':None,'status':'failed',
+                   'error':'same output %s as %s'
+                           % (name,owners[key]),
+                   'numsteps':0,'numvalid':0,'seconds':0.0}
+            continue
+        owners[key] = filename
+        items.append((filename,name))
+    worker = functools.partial(_solvenamed,mechanism=mechanism,outdir=outdir,
+                               **options)
+    if processes == 1:
+        for item in items:
+            yield worker(item)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        #a few files per task, but enough tasks to keep workers busy
+        workers = processes or os.cpu_count() or 1
+        chunksize = max(1,min(16,len(items)//(4*workers)))
+        for record in pool.imap_unordered(worker,items,chunksize):
+            yield record
+    finally:
+        pool.terminate()
+
+# Write the records, sorted by file, with counts by status
+def writeindex(outdir,records,**settings):
+    records = sorted(records,key=lambda record: record['file'])
+    counts = {}
+    for record in records:
+        counts[record['status']] = counts.get(record['status'],0) + 1
+    with open(os.path.join(outdir,INDEXFILE),'w') as f:
+        json.dump({'settings':settings,'counts':counts,'files':records},
+                  f,indent=1)
+    return counts
+
+#########################
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Solve a directory or glob of initial joints files.')
+    parser.add_argument('mechanism',
+                        help='fourbar, geared5bar, klann or linkage2')
+    parser.add_argument('inputs',nargs='+',help='directories or glob patterns')
+    parser.add_argument('-o','--outdir',default='BatchResults')
+    parser.add_argument('-j','--processes',type=int,default=None,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--pattern',default=None,
+                        help='files to take from directories '
+                             '(default *.txt, or *.linkage2)')
+    parser.add_argument('--numsteps',type=int,default=None)
+    parser.add_argument('--thetarange',type=float,default=None)
+    parser.add_argument('--gearratio',type=float,default=-2.0)
+    parser.add_argument('--branch',choices=('fixed','track'),default='fixed')
+    parser.add_argument('--format',dest='fmt',choices=sorted(EXTENSIONS),
+                        default='npz')
+    args = parser.parse_args(argv)
+
+    pattern = args.pattern or ('*.linkage2' if args.mechanism == 'linkage2'
+                               else '*.txt')
+    filenames = expandinputs(args.inputs,pattern)
+    options = dict(numsteps=args.numsteps,thetarange=args.thetarange,
+                   gearratio=args.gearratio,branch=args.branch,fmt=args.fmt)
+    tstart = time.time()
+    records = []
+    for record in runbatch(filenames,args.mechanism,args.outdir,
+                           args.processes,**options):
+        records.append(record)
+        print('%-13s %s%s' % (record['status'],record['file'],
+                              ('  ('+record['error']+')') if record['error'] else ''))
+    counts = writeindex(args.outdir,records,mechanism=args.mechanism,**options)
+    print('%d files in %.2f s: %s; index in %s'
+          % (len(records),time.time()-tstart,
+             ', '.join('%d %s' % (counts[s],s) for s in sorted(counts)),
+             os.path.join(args.outdir,INDEXFILE)))
+    return 0 if 'failed' not in counts else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
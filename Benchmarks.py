@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmarks for the kinematic kernels and the example
+mechanisms, with a check that the results still agree with the
+checked-in reference outputs.
+Contents:
+* REFERENCES: The reference tables and how to recompute them.
+* checkreferences(): Recompute each reference table and compare.
+* timeit(): Best-of-repeats wall time of a function call.
+* runbenchmarks(): Time every kernel and pipeline over a range of
+  step counts (and of design counts for the sweep), on each kernel
+  backend (see KinematicKernels.py).
+* compareresults(): Flag benchmarks that got slower than a baseline.
+
+Usage:
+  python Benchmarks.py check
+  python Benchmarks.py run -o bench.json [--maxsize 1e5] [--backend numba]
+  python Benchmarks.py run -o new.json --baseline bench.json
+  python Benchmarks.py compare bench.json new.json [--threshold 1.25]
+run checks the references first and exits with status 1 if they
+disagree; run with --baseline and compare exit with status 2 when
+something got slower than threshold times its baseline time.
+Results are JSON: a 'meta' dict (versions, platform, date) and a
+list of 'results' with name, backend, size and seconds. By default
+every available backend is timed.
+"""
+
+import sys
+import os
+import json
+import time
+import platform
+import argparse
+import numpy as np
+
+from LinkageUtilities import arcpoints, halfangle
+from KinematicKernels import (circcirc_batch, coupler, available_backends,
+                              usebackend)
+from Mechanism import compile_mechanism, solve_plan
+from MechanismExamples import buildexample, scriptthetas
+import Geared5BarSweep
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+#########################
+# Reference output files, with the example and input angles that
+# reproduce them and the joint columns in file order. The text files
+# are rounded to 0.01, so agreement is within half of that.
+# (KlannPlotPoints.txt was written with thetastart = 3.0.)
+REFERENCES = [
+    ('CircCirc4BarPoints.txt','fourbar',None,
+     ['joint23','joint34','coupler']),
+    ('Geared5BarOutput.txt','geared5bar',None,
+     ['joint23','joint34','joint45','coupler']),
+    ('KlannPlotPoints.txt','klann',(3.0,-1.9*np.pi,30),
+     ['joint23','joint34','joint36','joint56','foot']),
+    ('Jansen-lite-points.txt','jansenlite',None,
+     ['joint3','joint4','joint5','foot']),
+    ]
+REFERENCETOL = 0.005 + 1e-9
+
+# Recompute every reference table. Returns a list of
+# (filename, maximum difference, ok).
+def checkreferences(tol=REFERENCETOL):
+    report = []
+    for filename, name, angles, columns in REFERENCES:
+        mech = buildexample(name)
+        if angles is None:
+            thetas = scriptthetas(name,mech.theta0)
+        else:
+            thetas = np.linspace(*angles)
+        joints, valid = solve_plan(compile_mechanism(mech),thetas)
+        table = np.column_stack([joints[column] for column in columns])
+        reference = np.loadtxt(os.path.join(HERE,filename))
+        if table.shape != reference.shape:
+            report.append((filename,np.inf,False))
+            continue
+        error = np.max(np.abs(table-reference))
+        report.append((filename,error,bool(valid.all() and error <= tol)))
+    return report
+
+#########################
+# Best wall time of repeat runs of fn(*args). Quick calls are run in
+# loops long enough (mintime) to time reliably.
+def timeit(fn,args=(),repeat=5,mintime=0.05):
+    number = 1
+    while True:
+        tstart = time.perf_counter()
+        for i in range(number):
+            fn(*args)
+        elapsed = time.perf_counter()-tstart
+        if elapsed >= mintime or number >= 1000000:
+            break
+        number *= 10
+    best = elapsed/number
+    for i in range(repeat-1):
+        tstart = time.perf_counter()
+        for j in range(number):
+            fn(*args)
+        best = min(best,(time.perf_counter()-tstart)/number)
+    return best
+
+#########################
+# The benchmarks, as (name, function of size returning (fn, args)).
+# Sizes are numbers of steps, except for the sweep where they are
+# numbers of designs of 100 steps each. arcpoints and halfangle are
+# NumPy only, so they are timed on the numpy backend alone.
+def _kernelcases():
+    rng = np.random.RandomState(0)
+    def circcirccase(n):
+        p1 = rng.uniform(-1,1,(n,2))
+        return circcirc_batch, (p1,1.5,p1+rng.uniform(-1,1,(n,2)),1.2)
+    def arccase(n):
+        return arcpoints, (np.array([1.,2.]),3.,0.,2*np.pi,n)
+    def couplercase(n):
+        p1 = rng.uniform(-1,1,(n,2))
+        return coupler, (p1,rng.uniform(-1,1,(n,2)),2.,0.3)
+    def halfanglecase(n):
+        return halfangle, (np.linspace(0,2*np.pi,n),9.,3.,10.,6.,7.,0.7)
+    return [('circcirc_batch',circcirccase),('arcpoints',arccase),
+            ('coupler',couplercase),('halfangle',halfanglecase)]
+
+def _pipelinecases():
+    cases = []
+    for name in ('fourbar','geared5bar','klann','jansenlite'):
+        def case(n,name=name):
+            mech = buildexample(name)
+            thetas = np.linspace(mech.theta0,mech.theta0+2*np.pi,n)
+            return solve_plan, (compile_mechanism(mech),thetas)
+        cases.append(('pipeline:'+name,case))
+    return cases
+
+def _sweepcase(numdesigns):
+    pointsdata = np.loadtxt(os.path.join(HERE,'InitialJointsGeared5Bar.txt'))
+    rng = np.random.RandomState(1)
+    params = np.column_stack((rng.uniform(3.5,4.5,numdesigns),
+                              rng.uniform(9.,15.,numdesigns),
+                              rng.uniform(14.,20.,numdesigns),
+                              rng.uniform(4.,5.,numdesigns),
+                              rng.choice([-2.,2.,-3.],numdesigns),
+                              rng.uniform(0.,2*np.pi,numdesigns),
+                              np.full(numdesigns,8.),np.full(numdesigns,0.3)))
+    return Geared5BarSweep.solvechunk, (params,np.linspace(0.,-4*np.pi,100),
+                                        pointsdata[0,:],pointsdata[4,:])
+
+#########################
+# Run all benchmarks for step counts 10^2 .. maxsize and design counts
+# 1 .. maxdesigns, on each of backends (default: all available).
+# Returns the results dict written by 'run'.
+def runbenchmarks(maxsize=10**7,maxdesigns=10**4,repeat=3,backends=None,
+                  verbose=True):
+    sizes = [10**k for k in range(2,8) if 10**k <= maxsize]
+    designs = [10**k for k in range(0,5) if 10**k <= maxdesigns]
+    cases = [(name,case,sizes) for name,case in _kernelcases()+_pipelinecases()]
+    cases.append(('sweep:geared5bar',_sweepcase,designs))
+    results = []
+    for backend in (backends or available_backends()):
+        with usebackend(backend):
+            for name, case, counts in cases:
+                if backend != 'numpy' and name in ('arcpoints','halfangle'):
+                    continue
+                for n in counts:
+                    fn, args = case(n)
+                    fn(*args)       #compile (numba) before timing
+                    seconds = timeit(fn,args,repeat)
+                    results.append({'name':name,'backend':backend,'size':n,
+                                    'seconds':seconds})
+                    if verbose:
+                        print('%-24s %-6s %9d %12.3g s %10.3g s each'
+                              % (name,backend,n,seconds,seconds/n))
+    meta = {'python':platform.python_version(),'numpy':np.__version__,
+            'backends':list(available_backends()),
+            'platform':platform.platform(),'machine':platform.machine(),
+            'date':time.strftime('%Y-%m-%d %H:%M:%S')}
+    return {'meta':meta,'results':results}
+
+def _resultkey(r):
+    return (r['name'],r.get('backend','numpy'),r['size'])
+
+# Compare two results dicts. Returns a list of
+# (name, backend, size, baseline seconds, new seconds, ratio, slower)
+# for the benchmarks found in both, where slower means
+# ratio > threshold.
+def compareresults(baseline,new,threshold=1.25):
+    old = dict((_resultkey(r),r['seconds']) for r in baseline['results'])
+    report = []
+    for r in new['results']:
+        key = _resultkey(r)
+        if key in old:
+            ratio = r['seconds']/old[key]
+            report.append(key+(old[key],r['seconds'],ratio,ratio > threshold))
+    return report
+
+def _printcomparison(report):
+    for name, backend, size, told, tnew, ratio, slower in report:
+        print('%-24s %-6s %9d %10.3g -> %10.3g s  x%5.2f%s'
+              % (name,backend,size,told,tnew,ratio,
+                 '  SLOWER' if slower else ''))
+    return 2 if any(entry[-1] for entry in report) else 0
+
+def _printreferences():
+    ok = True
+    for filename, error, agrees in checkreferences():
+        print('%-24s max difference %.4f %s'
+              % (filename,error,'ok' if agrees else 'MISMATCH'))
+        ok = ok and agrees
+    return ok
+
+#########################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Linkage solver benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('check',help='compare with the reference outputs')
+    run = commands.add_parser('run',help='run the benchmarks')
+    run.add_argument('-o','--output',default='bench_output.json')
+    run.add_argument('--maxsize',type=float,default=1e7)
+    run.add_argument('--maxdesigns',type=float,default=1e4)
+    run.add_argument('--repeat',type=int,default=3)
+    run.add_argument('--backend',action='append',default=None,
+                     choices=('numpy','numba'),
+                     help='backend to time (repeatable; default: all available)')
+    run.add_argument('--baseline',default=None)
+    run.add_argument('--threshold',type=float,default=1.25)
+    compare = commands.add_parser('compare',help='compare two result files')
+    compare.add_argument('baseline')
+    compare.add_argument('new')
+    compare.add_argument('--threshold',type=float,default=1.25)
+    args = parser.parse_args(argv)
+
+    if args.command == 'check':
+        return 0 if _printreferences() else 1
+    if args.command == 'run':
+        if not _printreferences():
+            return 1
+        results = runbenchmarks(int(args.maxsize),int(args.maxdesigns),
+                                args.repeat,args.backend)
+        with open(args.output,'w') as f:
+            json.dump(results,f,indent=1)
+        print('Results written to %s' % args.output)
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            return _printcomparison(compareresults(baseline,results,
+                                                   args.threshold))
+        return 0
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        return _printcomparison(compareresults(baseline,new,args.threshold))
+    parser.print_help()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
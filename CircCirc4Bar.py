@@ -21,9 +21,9 @@ from matplotlib.pyplot import *  #Lazy...
 import os
 
 #load some handy utility functions:
-from ArcPoints import arcpoints
 from CircCirc import circcirc
-from CouplerPoint import coupler
+from Mechanism import Mechanism, compile_mechanism
+from TrajectoryCache import cachedsolve
 
 ####################################################################    
 #Make sure we are in the right directory...
@@ -83,19 +83,27 @@ elif(np.allclose(joint34[1,:],initjoints[2,:])):
 else:
     print('Hmmm, neither solution matches the input point...')
 
-# Use Arcpoints() to get the positions of joint23,
-# i.e., of the joint that connects links 2 and 3, where
-# link2 is the input crank.
-joints23 = arcpoints(initjoints[0,:],l2,thetastart,thetaend,numsteps)
-
-# For each joint23 location, find the corresponding
-# joint34 and coupler locations
-joints34 = np.zeros((numsteps,2),float)
-couplerpts = np.zeros((numsteps,2),float)
-for i in range(0,numsteps):   
-    intersects = circcirc(joints23[i,:],l3,initjoints[3,:],l4)
-    joints34[i,:] = intersects[assembly,:]
-    couplerpts[i,:] = coupler(joints34[i,:],joints23[i,:],lc,np.pi+gammac)
+# Describe the linkage with these lengths and assembly (see
+# Mechanism.py): joint23 connects links 2 and 3, where link2 is
+# the input crank, then joint34 and the coupler point.
+mech = Mechanism('fourbar')
+mech.ground('joint12',initjoints[0,:])
+mech.ground('joint14',initjoints[3,:])
+mech.crank('joint23','joint12',l2)
+mech.dyad('joint34','joint23',l3,'joint14',l4,assembly)
+mech.coupler('coupler','joint34','joint23',lc,np.pi+gammac)
+
+# Solve all the crank angles at once. cachedsolve() keeps the
+# result in the trajectory cache (see TrajectoryCache.py), so
+# running the script again loads it instead. It also tells us at
+# which steps the linkage can't be assembled.
+thetas = np.linspace(thetastart,thetaend,numsteps)
+joints, assemblable = cachedsolve(compile_mechanism(mech),thetas)
+if not assemblable.all():
+    print('Linkage cannot be assembled at %d of the steps' % np.sum(~assemblable))
+joints23 = joints['joint23']
+joints34 = joints['joint34']
+couplerpts = joints['coupler']
 
 
 #Plot the various points - may want to modify this depending
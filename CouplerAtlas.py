@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Atlas of coupler curves for looking up a design by the shape of its
+path, instead of trying link lengths in CircCirc4Bar.py or
+Geared5Bar.py until the curve looks right.
+An atlas is built once over grids of normalized designs (ground link
+of length 1) and stores for every design a short shape signature of
+its closed coupler curve that doesn't depend on where the curve is,
+how it is turned, how big it is or where along it the trace starts:
+the magnitudes of its first Fourier coefficients, scaled to unit
+size (see curvesignature()). The signatures are indexed with a k-d
+tree (scipy.spatial.cKDTree when SciPy is installed, else a brute
+force search), so the designs closest to a target curve come back
+in milliseconds.
+Contents:
+* curvesignature(): Shape signatures of closed curves (batched).
+* CouplerAtlas: Signatures plus designs; query() finds the k
+  closest designs to a target curve; save() writes an .npz file.
+* loadatlas(): Read a saved atlas.
+* fourbaratlas(): Atlas of four-bars (both assemblies) whose input
+  turns fully, over grids of l2, l3, l4, lc, gammac.
+* geared5baratlas(): Atlas of geared five-bars over the parameter
+  grid of Geared5BarSweep.py.
+
+Usage:
+  python CouplerAtlas.py build fourbar -o FourBarAtlas.npz
+  python CouplerAtlas.py query FourBarAtlas.npz CircCirc4BarPoints.txt \\
+      --columns 4 5 -k 5
+The target is read with np.loadtxt(); --columns picks its x and y
+columns (default the first two).
+"""
+
+import sys
+import argparse
+import numpy as np
+from fractions import Fraction
+
+from LinkageUtilities import halfangle, grashof_batch
+import Geared5BarSweep
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+#########################
+# Shape signatures of closed curves. points is ...xNx2 (N points per
+# curve, not repeating the first at the end). Each curve is resampled
+# at numsamples points evenly spaced along its length, and its
+# Fourier coefficients c[k] (as complex x+iy) found. Dropping c[0]
+# removes position; dividing by the root-mean-square size removes
+# scale; keeping only magnitudes removes rotation and starting
+# point. The signature is
+#   |c[1]|..|c[K]|, |c[-1]|..|c[-K]|     (K = numharmonics)
+# so the curve traced backwards has the two halves swapped.
+# Curves with NaNs (not assemblable) or of zero size give NaN.
+def curvesignature(points,numharmonics=8,numsamples=128):
+    points = np.asarray(points,float)
+    shape = points.shape[:-2]
+    points = points.reshape((-1,)+points.shape[-2:])
+    numcurves, numpoints = points.shape[0], points.shape[1]
+
+    #Arclength at each point, closing the curve, normalized to 0..1
+    closed = np.concatenate((points,points[:,:1,:]),axis=1)
+    steps = np.hypot(*np.moveaxis(np.diff(closed,axis=1),-1,0))
+    arclength = np.concatenate((np.zeros((numcurves,1)),
+                                np.cumsum(steps,axis=1)),axis=1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        u = arclength/arclength[:,-1:]
+    u = np.where(np.isfinite(u),u,0.0)
+
+    #Interpolate all curves at once: offset each row by its index so
+    #one searchsorted works on the concatenated, increasing rows
+    rows = np.arange(numcurves)[:,None]
+    targets = (np.arange(numsamples)/float(numsamples))[None,:] + 2.0*rows
+    flat = (u + 2.0*rows).reshape(-1)
+    index = np.searchsorted(flat,targets.reshape(-1),side='right') - 1
+    index = np.clip(index.reshape((numcurves,numsamples))
+                    - rows*(numpoints+1),0,numpoints-1)
+    u0 = np.take_along_axis(u,index,axis=1)
+    u1 = np.take_along_axis(u,index+1,axis=1)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        w = (targets - 2.0*rows - u0)/(u1-u0)
+    w = np.where(np.isfinite(w),w,0.0)[...,None]
+    p0 = np.take_along_axis(closed,index[...,None],axis=1)
+    p1 = np.take_along_axis(closed,index[...,None]+1,axis=1)
+    samples = p0 + w*(p1-p0)
+
+    coefficients = np.fft.fft(samples[...,0] + 1j*samples[...,1],
+                              axis=-1)/numsamples
+    magnitudes = np.abs(coefficients)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        size = np.sqrt(np.sum(magnitudes[:,1:]**2,axis=1))
+        signature = np.concatenate((magnitudes[:,1:numharmonics+1],
+                                    magnitudes[:,:-numharmonics-1:-1]),
+                                   axis=1)/size[:,None]
+    bad = ~np.isfinite(points).all(axis=(1,2)) | ~(size > 0)
+    signature[bad] = np.nan
+    return signature.reshape(shape+(2*numharmonics,))
+
+# Swap the +k and -k halves: the signature of the reversed curve
+def _reversed(signature):
+    half = signature.shape[-1]//2
+    return np.concatenate((signature[...,half:],signature[...,:half]),axis=-1)
+
+#########################
+# signatures is an MxS array from curvesignature(), designs an MxP
+# array of the parameters of each design, named by columns.
+# Rows with NaN signatures are dropped.
+class CouplerAtlas(object):
+
+    def __init__(self,signatures,designs,columns,kind='',numharmonics=None):
+        signatures = np.asarray(signatures,np.float32)
+        keep = np.isfinite(signatures).all(axis=1)
+        self.signatures = signatures[keep]
+        self.designs = np.asarray(designs,float)[keep]
+        self.columns = list(columns)
+        self.kind = kind
+        self.numharmonics = numharmonics or self.signatures.shape[1]//2
+        if cKDTree is not None:
+            self.tree = cKDTree(self.signatures)
+        else:
+            self.tree = None
+            self._squares = np.sum(self.signatures**2,axis=1)
+
+    def __len__(self):
+        return self.signatures.shape[0]
+
+    # Distances and rows (into designs) of the k designs whose
+    # curves are closest in shape to the Nx2 curve points, traced
+    # either way round.
+    def query(self,points,k=5):
+        signature = curvesignature(points,self.numharmonics)
+        if not np.isfinite(signature).all():
+            raise ValueError('target curve has no shape (NaN or single point)')
+        targets = np.vstack((signature,_reversed(signature)))
+        k = min(k,len(self))
+        if self.tree is not None:
+            distances, rows = self.tree.query(targets,k)
+            distances = np.reshape(distances,(2,k))
+            rows = np.reshape(rows,(2,k))
+        else:
+            #|s-t|**2 = |s|**2 - 2 s.t + |t|**2, as one matrix product
+            targets = targets.astype(np.float32)
+            squared = (self._squares[None,:] - 2*targets.dot(self.signatures.T)
+                       + np.sum(targets**2,axis=1)[:,None])
+            rows = np.argpartition(squared,k-1,axis=1)[:,:k]
+            distances = np.sqrt(np.maximum(
+                np.take_along_axis(squared,rows,axis=1),0.0)).astype(float)
+        distances, rows = distances.reshape(-1), rows.reshape(-1)
+        order = np.argsort(distances,kind='stable')
+        best, seen = [], set()
+        for i in order:
+            if rows[i] not in seen:
+                seen.add(rows[i])
+                best.append(i)
+            if len(best) == k:
+                break
+        return distances[best], rows[best]
+
+    # The designs of query() as a list of dicts, with the distance
+    def lookup(self,points,k=5):
+        distances, rows = self.query(points,k)
+        return [dict(zip(self.columns,self.designs[row].tolist()),
+                     distance=float(d)) for d,row in zip(distances,rows)]
+
+    def save(self,filename):
+        np.savez(filename,signatures=self.signatures,designs=self.designs,
+                 columns=np.array(self.columns),kind=np.array(self.kind),
+                 numharmonics=self.numharmonics)
+
+def loadatlas(filename):
+    with np.load(filename) as data:
+        return CouplerAtlas(data['signatures'],data['designs'],
+                            [str(c) for c in data['columns']],
+                            str(data['kind']),int(data['numharmonics']))
+
+#########################
+# Four-bars with ground link 1 from (0,0) to (1,0), input crank l2,
+# coupler l3, output l4 and the coupler point at distance lc from
+# the crank pin, at angle gammac from link3 (as in halfangle()).
+# Only designs whose input turns fully are kept (grashof_batch()),
+# each in both assemblies. designs columns are
+# l2, l3, l4, lc, gammac, inversion.
+def fourbaratlas(l2s,l3s,l4s,lcs,gammacs,numsteps=180,numharmonics=8,
+                 chunksize=4096):
+    grid = np.stack(np.meshgrid(l2s,l3s,l4s,indexing='ij'),
+                    axis=-1).reshape((-1,3)).astype(float)
+    links = np.column_stack((np.ones(grid.shape[0]),grid))
+    grid = grid[grashof_batch(links)['inputturns']]
+    offsets = np.stack(np.meshgrid(lcs,gammacs,indexing='ij'),
+                       axis=-1).reshape((-1,2)).astype(float)
+    designs = np.column_stack((np.repeat(grid,offsets.shape[0],axis=0),
+                               np.tile(offsets,(grid.shape[0],1))))
+
+    thetas = np.linspace(0.,2*np.pi,numsteps,endpoint=False)
+    signatures = []
+    for start in range(0,designs.shape[0],chunksize):
+        d = designs[start:start+chunksize]
+        curves = halfangle(thetas,1.0,d[:,0:1],d[:,1:2],d[:,2:3],
+                           d[:,3:4],d[:,4:5])['coupler']     #2xDxSx2
+        signatures.append(curvesignature(curves,numharmonics))
+    signatures = np.concatenate(signatures,axis=1)   #both inversions
+    numdesigns = designs.shape[0]
+    designs = np.vstack((np.column_stack((designs,np.zeros(numdesigns))),
+                         np.column_stack((designs,np.ones(numdesigns)))))
+    return CouplerAtlas(signatures.reshape((-1,2*numharmonics)),designs,
+                        ['l2','l3','l4','lc','gammac','inversion'],
+                        'fourbar',numharmonics)
+
+# Input rotation after which a geared five-bar with this gear ratio
+# repeats: the output turns 1/gearratio as fast as the input.
+def _gearperiod(gearratio):
+    return 2*np.pi*Fraction(1.0/gearratio).limit_denominator(1000).denominator
+
+# Geared five-bars with ground pivots (0,0) and (1,0), over axes,
+# 8 arrays of values in the order of Geared5BarSweep.PARAMETERS.
+# Each curve covers one period of its gear ratio, in numsteps steps;
+# designs that can't be assembled all the way round are dropped.
+# designs columns are Geared5BarSweep.PARAMETERS.
+def geared5baratlas(axes,numsteps=180,numharmonics=8,assembly=0,
+                    chunksize=4096):
+    signatures, designs = [], []
+    for gearratio in np.unique(np.asarray(axes[4],float)):
+        gearaxes = list(axes)
+        gearaxes[4] = [gearratio]
+        thetas = np.linspace(0.,-_gearperiod(gearratio),numsteps,endpoint=False)
+        for params in Geared5BarSweep.gridchunks(gearaxes,chunksize):
+            results = Geared5BarSweep.solvechunk(params,thetas,(0.,0.),(1.,0.),
+                                                 assembly,keepcurves=True)
+            keep = results['valid']
+            signatures.append(curvesignature(results['coupler'][keep],
+                                             numharmonics))
+            designs.append(params[keep])
+    return CouplerAtlas(np.concatenate(signatures),np.concatenate(designs),
+                        Geared5BarSweep.PARAMETERS,'geared5bar',numharmonics)
+
+#########################
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Coupler-curve atlas')
+    commands = parser.add_subparsers(dest='command')
+    build = commands.add_parser('build',help='build an atlas')
+    build.add_argument('kind',choices=('fourbar','geared5bar'))
+    build.add_argument('-o','--output',required=True)
+    build.add_argument('--numsteps',type=int,default=180)
+    query = commands.add_parser('query',help='closest designs to a curve')
+    query.add_argument('atlas')
+    query.add_argument('target')
+    query.add_argument('--columns',type=int,nargs=2,default=(0,1))
+    query.add_argument('-k',type=int,default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        if args.kind == 'fourbar':
+            lengths = np.linspace(0.2,3.0,15)
+            atlas = fourbaratlas(lengths,lengths,lengths,np.linspace(0.,2.,9),
+                                 np.linspace(-np.pi,np.pi,16,endpoint=False),
+                                 args.numsteps)
+        else:
+            atlas = geared5baratlas([np.linspace(0.1,0.5,5),np.linspace(0.6,1.6,6),
+                                     np.linspace(0.6,1.6,6),np.linspace(0.1,0.5,5),
+                                     [-2.,2.,-3.],
+                                     np.linspace(0.,2*np.pi,12,endpoint=False),
+                                     np.linspace(0.,1.,5),
+                                     np.linspace(-np.pi,np.pi,8,endpoint=False)],
+                                    args.numsteps)
+        atlas.save(args.output)
+        print('%d %s designs written to %s' % (len(atlas),atlas.kind,args.output))
+        return 0
+    if args.command == 'query':
+        atlas = loadatlas(args.atlas)
+        target = np.loadtxt(args.target)[:,list(args.columns)]
+        for design in atlas.lookup(target,args.k):
+            print('  '.join('%s=%.4g' % (name,design[name])
+                            for name in atlas.columns+['distance']))
+        return 0
+    parser.print_help()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -9,13 +9,17 @@ import numpy as np
 
 #Useful for plotting coupler points or end
 #points of bent links. 
-#point1, point2 and cpoint are 2-element arrays
+#point1, point2 and cpoint are 2-element arrays, or Nx2
+#trajectories to get a whole Nx2 trajectory of cpoints at once
+#(r and theta may then be scalars or N-element arrays).
 def coupler(point1,point2,r,theta):
+      point1 = np.asarray(point1,float)
+      point2 = np.asarray(point2,float)
       delta = point2-point1
-      phi = np.arctan2(delta[1],delta[0])
+      phi = np.arctan2(delta[...,1],delta[...,0])
       psi = phi+theta
       rx = r*np.cos(psi)
       ry = r*np.sin(psi)
-      cpoint = point2+np.array([rx,ry])
+      cpoint = point2+np.stack((rx,ry),axis=-1)
       return cpoint
       
\ No newline at end of file
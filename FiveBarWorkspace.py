@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+Workspace of the open (ungeared) five-bar of Geared5Bar.py, for
+choosing its gear ratio and phase.
+Without the gears the five-bar has two inputs, the crank angles
+theta2 and theta5, so its configurations cover a torus. The gears
+only pick a line on it,
+  theta5 = phase + theta2/gearratio
+(as in Geared5BarSweep.py), and a design works if that line stays
+where the five-bar can be assembled, away from poor transmission.
+workspacemap() solves the whole torus once, on a grid of theta2 by
+theta5 with one circcirc_batch() call (joint23 only depends on
+theta2 and joint45 only on theta5, so the grid is just every pair),
+and gearline() reads any ratio and phase off it by interpolation,
+so trying another ratio or phase costs a lookup instead of a solve.
+The maps, NaN where the five-bar can't be assembled:
+  'coupler'      - coupler point
+  'transmission' - |sin(mu)|, mu the angle between link3 and link4
+                   at joint34: 1 is best, 0 a toggle position
+  'margin'       - distance from a toggle position: the smaller of
+                   (l3+l4) - r and r - |l3-l4|, r the distance from
+                   joint23 to joint45; >= 0 where it can be assembled
+                   (given everywhere, so the edge of the assemblable
+                   region can be interpolated too)
+Interpolation is bilinear and periodic in both angles, with errors
+of order the square of the grid step away from the edge of the
+assemblable region; the coupler point moves fastest near the edge
+(like a square root of the margin) and is NaN within a grid step
+of it.
+Contents:
+* workspacemap(): Maps over the (theta2, theta5) torus.
+* planworkspace(): workspacemap() of a compiled geared five-bar
+  plan, with its own gear ratio and phase.
+* lineperiod(): Input rotation after which a gear line closes.
+* gearline(): Interpolate the maps along a gear ratio and phase line.
+* scanlines(): Assemblable fraction and worst transmission of many
+  ratio and phase lines.
+
+Example:
+    plan = compile_mechanism(buildexample('geared5bar'))
+    workspace = planworkspace(plan,360)
+    line = gearline(workspace,-2.,workspace['phase'],
+                    np.linspace(0.,4*np.pi,240))
+    scan = scanlines(workspace,[-3.,-2.,2.,3.],np.linspace(0,2*np.pi,72))
+
+Usage:
+  python FiveBarWorkspace.py [gearratio ...]
+"""
+
+import sys
+import numpy as np
+from fractions import Fraction
+
+from KinematicKernels import circcirc_batch, coupler
+from Profiling import stage as profilestage
+
+#########################
+# Maps of the five-bar with link lengths l2..l5 and coupler lc,
+# gammac as in Geared5BarSweep.py, ground pivots joint12 and joint15,
+# over numtheta2 by numtheta5 (default the same) crank angles evenly
+# covering 0..2*pi (without 2*pi). Returns a dict with the maps
+# described above (numtheta2 x numtheta5, the coupler x2), 'valid',
+# the grid angles 'theta2' and 'theta5', and the design parameters.
+def workspacemap(l2,l3,l4,l5,lc,gammac,joint12,joint15,numtheta2=360,
+                 numtheta5=None,assembly=0):
+    joint12 = np.asarray(joint12,float)
+    joint15 = np.asarray(joint15,float)
+    numtheta5 = numtheta5 or numtheta2
+    theta2 = 2*np.pi*np.arange(numtheta2)/float(numtheta2)
+    theta5 = 2*np.pi*np.arange(numtheta5)/float(numtheta5)
+    shape = (numtheta2,numtheta5)
+    size = numtheta2*numtheta5
+
+    with profilestage('workspace cranks',size):
+        joints23 = joint12 + l2*np.column_stack((np.cos(theta2),np.sin(theta2)))
+        joints45 = joint15 + l5*np.column_stack((np.cos(theta5),np.sin(theta5)))
+        joints23 = np.broadcast_to(joints23[:,None,:],shape+(2,)).reshape((-1,2))
+        joints45 = np.broadcast_to(joints45[None,:,:],shape+(2,)).reshape((-1,2))
+    with profilestage('workspace dyad',size):
+        intersects, valid = circcirc_batch(joints23,l3,joints45,l4)
+        joints34 = intersects[:,assembly,:]
+    with profilestage('workspace coupler',size):
+        couplerpts = coupler(joints45,joints34,lc,gammac)
+
+    a = joints23 - joints34
+    b = joints45 - joints34
+    with np.errstate(invalid='ignore'):
+        transmission = np.abs(a[:,0]*b[:,1] - a[:,1]*b[:,0])/(l3*l4)
+    r = np.hypot(*(joints45-joints23).T)
+    margin = np.minimum((l3+l4) - r,r - abs(l3-l4))
+    return {'theta2':theta2,'theta5':theta5,'valid':valid.reshape(shape),
+            'margin':margin.reshape(shape),
+            'coupler':couplerpts.reshape(shape+(2,)),
+            'transmission':transmission.reshape(shape),
+            'l2':l2,'l3':l3,'l4':l4,'l5':l5,'lc':lc,'gammac':gammac,
+            'joint12':joint12,'joint15':joint15,'assembly':assembly}
+
+# workspacemap() of a plan from compile_mechanism() laid out as the
+# geared5bar example of MechanismExamples.py: an input crank joint23
+# about joint12, a second crank joint45 about joint15, the dyad
+# joint34 on the two, and a coupler point on joint45 -> joint34.
+# Also returns the plan's own line as 'gearratio' and 'phase'.
+def planworkspace(plan,numtheta2=360,numtheta5=None):
+    stages = dict((stage[1],stage) for stage in plan)
+    cranks = [stage for stage in plan if stage[0] == 'crank']
+    dyads = [stage for stage in plan if stage[0] == 'dyad']
+    couplers = [stage for stage in plan if stage[0] == 'coupler']
+    if len(cranks) != 2 or len(dyads) != 1 or len(couplers) > 1:
+        raise ValueError('plan is not a geared five-bar')
+    crank2, crank5 = cranks
+    dyad = dyads[0]
+    if dyad[2] != crank2[1] or dyad[4] != crank5[1]:
+        raise ValueError('the dyad must join the input crank to the second crank')
+    lc, gammac = 0.0, 0.0
+    if couplers:
+        if couplers[0][2:4] != (crank5[1],dyad[1]):
+            raise ValueError('the coupler point must be on %s -> %s'
+                             % (crank5[1],dyad[1]))
+        lc, gammac = couplers[0][4], couplers[0][5]
+    workspace = workspacemap(crank2[3],dyad[3],dyad[5],crank5[3],lc,gammac,
+                             stages[crank2[2]][2],stages[crank5[2]][2],
+                             numtheta2,numtheta5,dyad[6])
+    #theta2 = phase2 + ratio2*theta, theta5 = phase5 + ratio5*theta
+    ratio = crank5[5]/crank2[5]
+    workspace['gearratio'] = 1.0/ratio
+    workspace['phase'] = crank5[4] - ratio*crank2[4]
+    return workspace
+
+# Rotation of theta2 after which the line of gearratio closes on
+# the torus (e.g. 4*pi for -2). gearratio must be rational.
+def lineperiod(gearratio,maxden=1000):
+    fraction = Fraction(1.0/gearratio).limit_denominator(maxden)
+    if abs(float(fraction)-1.0/gearratio) > 1e-9*max(1.0,abs(1.0/gearratio)):
+        raise ValueError('gear ratio %g is not rational; no period' % gearratio)
+    return 2*np.pi*fraction.denominator
+
+#########################
+# Bilinear, periodic interpolation of field (numtheta2 x numtheta5
+# x ...) at angles theta2, theta5 (arrays that broadcast together)
+def _interpolate(field,theta2,theta5):
+    numtheta2, numtheta5 = field.shape[:2]
+    u = np.mod(theta2*(numtheta2/(2*np.pi)),numtheta2)
+    v = np.mod(theta5*(numtheta5/(2*np.pi)),numtheta5)
+    i0 = np.floor(u).astype(int) % numtheta2
+    k0 = np.floor(v).astype(int) % numtheta5
+    i1 = (i0+1) % numtheta2
+    k1 = (k0+1) % numtheta5
+    extra = (slice(None),) + (None,)*(field.ndim-2)
+    wu = (u - np.floor(u))[extra]
+    wv = (v - np.floor(v))[extra]
+    return ((1-wu)*((1-wv)*field[i0,k0] + wv*field[i0,k1])
+            + wu*((1-wv)*field[i1,k0] + wv*field[i1,k1]))
+
+# The maps of workspace along theta5 = phase + theta2/gearratio at
+# input angles thetas (theta2). gearratio and phase may be arrays
+# broadcasting with thetas. Returns a dict with 'theta2', 'theta5',
+# 'valid' (interpolated margin >= 0), 'margin', 'coupler' and
+# 'transmission'.
+def gearline(workspace,gearratio,phase,thetas):
+    theta2, gearratio, phase = np.broadcast_arrays(
+        np.asarray(thetas,float),np.asarray(gearratio,float),
+        np.asarray(phase,float))
+    theta5 = phase + theta2/gearratio
+    flat2, flat5 = theta2.reshape(-1), theta5.reshape(-1)
+    line = {'theta2':theta2,'theta5':theta5}
+    for name in ('margin','coupler','transmission'):
+        values = _interpolate(workspace[name],flat2,flat5)
+        line[name] = values.reshape(theta2.shape+values.shape[1:])
+    line['valid'] = line['margin'] >= 0
+    return line
+
+# Summary of every combination of gearratios and phases, each line
+# sampled at numsteps points per turn of theta2 over lineperiod().
+# Returns a dict of R x P arrays:
+#   'fraction'     - fraction of the line that can be assembled
+#   'valid'        - True if all of it can
+#   'transmission' - worst (smallest) |sin(mu)| along the line
+#   'margin'       - smallest distance from a toggle position
+def scanlines(workspace,gearratios,phases,numsteps=360):
+    gearratios = np.atleast_1d(np.asarray(gearratios,float))
+    phases = np.atleast_1d(np.asarray(phases,float))
+    results = dict((name,np.zeros((gearratios.shape[0],phases.shape[0])))
+                   for name in ('fraction','transmission','margin'))
+    for n, gearratio in enumerate(gearratios):
+        period = lineperiod(gearratio)
+        count = int(round(numsteps*period/(2*np.pi)))
+        thetas = period*np.arange(count)/float(count)
+        line = gearline(workspace,gearratio,phases[:,None],thetas[None,:])
+        results['fraction'][n] = np.mean(line['valid'],axis=1)
+        results['margin'][n] = np.min(line['margin'],axis=1)
+        transmission = line['transmission']
+        usable = line['valid'] & ~np.isnan(transmission)
+        results['transmission'][n] = np.min(np.where(usable,transmission,np.inf),
+                                            axis=1)
+    results['transmission'][np.isinf(results['transmission'])] = np.nan
+    results['valid'] = results['fraction'] == 1.0
+    return results
+
+#########################
+if __name__ == '__main__':
+    import time
+    from Mechanism import compile_mechanism
+    from MechanismExamples import buildexample
+    gearratios = [float(x) for x in sys.argv[1:]] or [-3.,-2.,-1.5,1.5,2.,3.]
+    plan = compile_mechanism(buildexample('geared5bar'))
+    tstart = time.time()
+    workspace = planworkspace(plan,360)
+    print('%.1f%% of the (theta2, theta5) torus can be assembled, %.3f s'
+          % (100*np.mean(workspace['valid']),time.time()-tstart))
+    print('As drawn: gear ratio %g, phase %.4g deg'
+          % (workspace['gearratio'],np.degrees(workspace['phase'])))
+    phases = np.linspace(0.,2*np.pi,72,endpoint=False)
+    tstart = time.time()
+    scan = scanlines(workspace,gearratios,phases)
+    print('%d lines scanned in %.3f s' % (scan['fraction'].size,time.time()-tstart))
+    for n, gearratio in enumerate(gearratios):
+        good = np.flatnonzero(scan['valid'][n])
+        if not good.size:
+            print('  gear ratio %5g: no phase assembles the whole cycle '
+                  '(best %.0f%%)' % (gearratio,100*np.max(scan['fraction'][n])))
+            continue
+        best = good[np.argmax(scan['transmission'][n,good])]
+        print('  gear ratio %5g: %2d of %d phases assemble, best %.4g deg '
+              '(worst |sin(mu)| %.3f)'
+              % (gearratio,good.size,phases.shape[0],np.degrees(phases[best]),
+                 scan['transmission'][n,best]))
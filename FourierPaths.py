@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Closed paths (coupler curves, Klann and Jansen feet) as short
+Fourier series instead of dense Nx2 tables.
+Over one period of the input (see cyclethetas() in Mechanism.py) a
+joint path is periodic, so with z = x + iy
+  z(theta) = sum over k = -K..K of c[k]*exp(i*k*t)
+where t runs once round 0..2*pi over the period. Smooth linkage
+paths need only a few harmonics for an error far below drawing
+precision, so storing c[-K..K] takes a small fraction of the space,
+the path can be rebuilt at any number of steps, and two paths can
+be compared from their coefficients alone.
+Contents:
+* fourierfit(): Coefficients of paths sampled evenly over a period,
+  truncated to the fewest harmonics within an error bound.
+* harmonics(): The k of each coefficient.
+* fourierpoints(): Rebuild paths at any number of steps.
+* shapedistance(): Distance between paths from their coefficients,
+  optionally ignoring position, size, rotation and start phase.
+
+Example:
+    plan = compile_mechanism(buildexample('klann'))
+    thetas = cyclethetas(plan,0.,360)
+    joints, valid = solve_plan(plan,thetas)
+    coefficients, bound = fourierfit(joints['foot'],tol=0.005)
+    foot = fourierpoints(coefficients,3600)   #10 times finer
+
+Usage:
+  python FourierPaths.py     (checks the error bounds)
+"""
+
+import warnings
+import numpy as np
+
+#########################
+# Fourier coefficients of paths. points is ...xNx2: N points evenly
+# spaced in input angle over exactly one period (without repeating
+# the first point at the end). Keeps the harmonics k = -K..K, with K
+# either numharmonics or the smallest for which the error bound is
+# at most tol (in the units of points) for every path; the default
+# tol is 1e-6 of the largest extent of the paths.
+# Returns coefficients, ...x(2K+1) complex in order k = -K..K, and
+# bound, the error bound of each path: the sum of the magnitudes of
+# the dropped coefficients, which no rebuilt point (at the sample
+# angles, or in between for the trigonometric interpolant) can be
+# further from the path than. K is at most (N-1)/2. Paths with NaNs
+# give NaN coefficients.
+def fourierfit(points,tol=None,numharmonics=None):
+    points = np.asarray(points,float)
+    numpoints = points.shape[-2]
+    c = np.fft.fft(points[...,0] + 1j*points[...,1],axis=-1)/numpoints
+
+    #Magnitudes summed by |k|, and what dropping all above each K costs
+    level = np.abs(np.fft.fftfreq(numpoints,1.0/numpoints)).astype(int)
+    maxlevel = (numpoints-1)//2
+    onehot = (level[:,None] == np.arange(numpoints//2+1)[None,:])
+    bylevel = np.abs(c).dot(onehot)
+    tails = np.cumsum(bylevel[...,::-1],axis=-1)[...,::-1]
+    tails = np.concatenate((tails[...,1:],np.zeros(tails.shape[:-1]+(1,))),
+                           axis=-1)                  #tails[K] = dropped above K
+
+    if numharmonics is None:
+        if tol is None:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore',RuntimeWarning)   #all-NaN paths
+                extent = np.nanmax(points,axis=-2) - np.nanmin(points,axis=-2)
+                tol = 1e-6*np.nanmax(extent)
+        finite = np.isfinite(tails).all(axis=-1)
+        enough = tails[finite].reshape((-1,tails.shape[-1])) <= tol
+        needed = np.argmax(enough,axis=-1) if enough.size else np.zeros(1,int)
+        numharmonics = int(np.max(needed,initial=0))
+    numharmonics = min(int(numharmonics),maxlevel)
+
+    index = np.arange(-numharmonics,numharmonics+1) % numpoints
+    bound = tails[...,numharmonics]        #includes the Nyquist term of even N
+    return c[...,index], bound
+
+# The harmonic number k of each coefficient of fourierfit()
+def harmonics(coefficients):
+    numharmonics = (np.shape(coefficients)[-1]-1)//2
+    return np.arange(-numharmonics,numharmonics+1)
+
+#########################
+# Rebuild ...xnumstepsx2 paths from coefficients, at numsteps angles
+# evenly spaced over the period starting at t = phase (0 is the
+# first point given to fourierfit()).
+def fourierpoints(coefficients,numsteps,phase=0.0):
+    coefficients = np.asarray(coefficients,complex)
+    k = harmonics(coefficients)
+    coefficients = coefficients*np.exp(1j*k*phase)
+    if numsteps >= k.shape[0]:
+        #inverse FFT with the coefficients placed at k mod numsteps
+        spectrum = np.zeros(coefficients.shape[:-1]+(numsteps,),complex)
+        spectrum[...,k % numsteps] = coefficients
+        z = np.fft.ifft(spectrum,axis=-1)*numsteps
+    else:
+        t = 2*np.pi*np.arange(numsteps)/float(numsteps)
+        z = coefficients.dot(np.exp(1j*np.outer(k,t)))
+    return np.stack((z.real,z.imag),axis=-1)
+
+# Pad or cut coefficients to K harmonics
+def _resize(coefficients,numharmonics):
+    k = (coefficients.shape[-1]-1)//2
+    if k >= numharmonics:
+        return coefficients[...,k-numharmonics:k+numharmonics+1]
+    pad = [(0,0)]*(coefficients.ndim-1) + [(numharmonics-k,numharmonics-k)]
+    return np.pad(coefficients,pad)
+
+#########################
+# Distance between paths a and b (coefficient arrays that broadcast
+# against each other; they may have different numbers of harmonics).
+# By Parseval's theorem
+#   sqrt(sum |a[k]-b[k]|**2)
+# is the root-mean-square distance between corresponding points of
+# the two paths over the period, so no points are needed.
+# With invariant=True the paths are first moved to a common centre
+# (c[0] dropped) and scaled to unit size, and the distance is the
+# smallest over rotations of b and shifts of its start phase (the
+# best rotation is found exactly, the best shift on a grid of
+# numshifts per harmonic, refined by a parabola through the best
+# three). Returns 0 for the same shape, at most 2.
+def shapedistance(a,b,invariant=False,numshifts=8):
+    a = np.asarray(a,complex)
+    b = np.asarray(b,complex)
+    numharmonics = max(a.shape[-1],b.shape[-1])//2
+    a = _resize(a,numharmonics)
+    b = _resize(b,numharmonics)
+    if not invariant:
+        return np.sqrt(np.sum(np.abs(a-b)**2,axis=-1))
+
+    k = harmonics(a)
+    keep = k != 0
+    a, b, k = a[...,keep], b[...,keep], k[keep]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        a = a/np.sqrt(np.sum(np.abs(a)**2,axis=-1,keepdims=True))
+        b = b/np.sqrt(np.sum(np.abs(b)**2,axis=-1,keepdims=True))
+    #|a - b*exp(i*(alpha+k*tau))|**2 = 2 - 2*Re(exp(i*alpha)*S(tau))
+    #with S(tau) = sum conj(a)*b*exp(i*k*tau); best alpha gives |S|
+    numtau = numshifts*(2*numharmonics+1)
+    step = 2*np.pi/numtau
+    products = np.conj(a)*b
+    s = np.abs(products.dot(np.exp(1j*np.outer(k,step*np.arange(numtau)))))
+    best = np.argmax(s,axis=-1)[...,None]
+    s0 = np.take_along_axis(s,(best-1) % numtau,axis=-1)[...,0]
+    s1 = np.take_along_axis(s,best,axis=-1)[...,0]
+    s2 = np.take_along_axis(s,(best+1) % numtau,axis=-1)[...,0]
+    with np.errstate(invalid='ignore',divide='ignore'):
+        offset = np.clip(0.5*(s0-s2)/(s0-2*s1+s2),-0.5,0.5)
+    offset = np.where(np.isfinite(offset),offset,0.0)
+    tau = step*(best[...,0] + offset)
+    refined = np.abs(np.sum(products*np.exp(1j*k*tau[...,None]),axis=-1))
+    return np.sqrt(np.maximum(2 - 2*np.maximum(s1,refined),0.0))
+
+#########################
+if __name__ == '__main__':
+    #The bound must hold for random paths of odd and even length. At
+    #full order an even path only drops its Nyquist term, whose size
+    #is exactly the error at every sample, so there it must be tight.
+    rng = np.random.default_rng(0)
+    for numpoints in (8,9,64,65):
+        points = rng.normal(size=(numpoints,2))
+        for numharmonics in (1,(numpoints-1)//2):
+            coefficients, bound = fourierfit(points,numharmonics=numharmonics)
+            rebuilt = fourierpoints(coefficients,numpoints)
+            error = np.max(np.hypot(*(rebuilt-points).T))
+            assert error <= bound + 1e-12, (numpoints,numharmonics)
+            if numpoints % 2 == 0 and numharmonics == (numpoints-1)//2:
+                assert abs(error-bound) <= 1e-12, (numpoints,numharmonics)
+            print('N = %3d, K = %3d: error %.6g <= bound %.6g'
+                  % (numpoints,numharmonics,error,bound))
@@ -15,7 +15,9 @@ from matplotlib.pyplot import *  #Lazy...
 import os
 
 #Import handy utility functions:
-from LinkageUtilities import arcpoints, circcirc, coupler, grashof
+from LinkageUtilities import circcirc, grashof
+from Mechanism import Mechanism, compile_mechanism
+from TrajectoryCache import cachedsolve
 
 ####################################################################    
 #Make sure we are in the right directory...
@@ -74,7 +76,6 @@ lc = np.linalg.norm(dc4)
 theta2start = np.arctan2(d12[1],d12[0])
 theta5start = np.arctan2(d54[1],d54[0])
 theta2end = theta2start + thetarange
-theta5end = theta5start + thetarange/gearratio
 
 # Find the angle gammac between link4 and coupler
 gamma1 = np.arctan2(-d34[1],-d34[0])
@@ -94,18 +95,29 @@ elif(np.allclose(joint34[1,:],initjoints[2,:])):
 else:
     print('Hmmm, neither solution matches the input point...')
 
-# Use Arcpoints() to get the positions of joint23,and joint45
-joints23 = arcpoints(initjoints[0,:],l2,theta2start,theta2end,numsteps)
-joints45 = arcpoints(initjoints[4,:],l5,theta5start,theta5end,numsteps)
-
-# For each joint23 location, find the corresponding
-# joint34 and coupler locations
-joints34 = np.zeros((numsteps,2),float)
-couplerpts = np.zeros((numsteps,2),float)
-for i in range(0,numsteps):   
-    intersects = circcirc(joints23[i,:],l3,joints45[i,:],l4)
-    joints34[i,:] = intersects[assembly,:]
-    couplerpts[i,:] = coupler(joints45[i,:],joints34[i,:],lc,gammac)
+# Describe the linkage with these lengths and assembly (see
+# Mechanism.py): joint45 is geared to the input crank, starting
+# at theta5start when joint23 is at theta2start.
+mech = Mechanism('geared5bar',theta0=theta2start)
+mech.ground('joint12',initjoints[0,:])
+mech.ground('joint15',initjoints[4,:])
+mech.crank('joint23','joint12',l2)
+mech.gear('joint45','joint15',l5,'joint23',gearratio,theta5start,theta2start)
+mech.dyad('joint34','joint23',l3,'joint45',l4,assembly)
+mech.coupler('coupler','joint45','joint34',lc,gammac)
+
+# Solve all the input angles at once. cachedsolve() keeps the
+# result in the trajectory cache (see TrajectoryCache.py), so
+# running the script again loads it instead. It also tells us at
+# which steps the linkage can't be assembled.
+thetas = np.linspace(theta2start,theta2end,numsteps)
+joints, assemblable = cachedsolve(compile_mechanism(mech),thetas)
+if not assemblable.all():
+    print('Linkage cannot be assembled at %d of the steps' % np.sum(~assemblable))
+joints23 = joints['joint23']
+joints45 = joints['joint45']
+joints34 = joints['joint34']
+couplerpts = joints['coupler']
 
 
 #Plot the various points - may want to modify this depending
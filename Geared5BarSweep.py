@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Design-space sweep for the geared five-bar of Geared5Bar.py.
+Instead of editing link lengths and gearratio in the script and
+rerunning it, give arrays of candidate values and let sweep()
+solve them in chunks spread over a process pool.
+Each design is one row of PARAMETERS:
+  l2, l3, l4, l5 - link lengths, as in Geared5Bar.py
+  gearratio      - input gear rotations per output rotation
+  phase          - output crank angle theta5 when theta2 = 0, so
+                   theta5 = phase + theta2/gearratio
+  lc, gammac     - coupler offset on link4: distance from joint34
+                   and angle from link4, as in Geared5Bar.py
+The ground pivots joint12 and joint15 are shared by all designs.
+Contents:
+* gridsize(): Number of designs in a grid of parameter values.
+* gridchunks(): Generate the grid in chunks of rows, without
+  building the whole grid in memory.
+* arraychunks(): Split an existing Mx8 array of designs into chunks.
+* solvechunk(): Solve a chunk of designs for all input angles, using
+  one circcirc_batch() call for all designs and steps together.
+* cachedsolvechunk(): solvechunk() through the trajectory cache.
+* sweep(): Solve chunks over a process pool and stream back results.
+
+Example:
+    axes = [[3.5,4.1],np.linspace(10,14,50),np.linspace(10,14,50),
+            [3.5,4.1],[-2.,2.],np.linspace(0,2*np.pi,36),[10.],[0.5]]
+    thetas = np.linspace(0.,-4*np.pi,120)
+    for start, results in sweep(gridchunks(axes,4096),thetas,
+                                (-48.2,23.55),(-66.94,23.55)):
+        good = start + np.flatnonzero(results['valid'])
+
+Usage:
+  python Geared5BarSweep.py [--profile]
+"""
+
+import numpy as np
+import multiprocessing
+import functools
+import warnings
+
+from LinkageUtilities import trackbranch
+from KinematicKernels import circcirc_batch, coupler, get_backend
+from TrajectoryCache import cachekey, getcache
+from Profiling import stage as profilestage, getprofiler, profiledcall
+
+PARAMETERS = ('l2','l3','l4','l5','gearratio','phase','lc','gammac')
+
+#########################
+# axes is a sequence of 8 arrays of values, one per PARAMETERS entry.
+def gridsize(axes):
+    return int(np.prod([len(values) for values in axes]))
+
+# Generate all combinations of the values in axes as Mx8 arrays
+# of at most chunksize rows, in the order of itertools.product().
+def gridchunks(axes,chunksize=4096):
+    axes = [np.asarray(values,float) for values in axes]
+    if len(axes) != len(PARAMETERS):
+        raise ValueError('need %d parameter axes, got %d'
+                         % (len(PARAMETERS),len(axes)))
+    shape = tuple(len(values) for values in axes)
+    total = gridsize(axes)
+    for start in range(0,total,chunksize):
+        index = np.unravel_index(np.arange(start,min(start+chunksize,total)),shape)
+        yield np.column_stack([values[i] for values,i in zip(axes,index)])
+
+# Split an Mx8 array of designs into chunks of at most chunksize rows
+def arraychunks(params,chunksize=4096):
+    params = np.asarray(params,float)
+    for start in range(0,params.shape[0],chunksize):
+        yield params[start:start+chunksize,:]
+
+#########################
+# Solve a Dx8 chunk of designs for the S input angles thetas.
+# All D*S joint34 positions come from one circcirc_batch() call.
+# Returns a dict of compact per-design arrays:
+#   'valid'    - D booleans, True if assemblable at every step
+#   'fraction' - fraction of steps that can be assembled (float32)
+#   'bbox'     - Dx4 coupler bounding box xmin, ymin, xmax, ymax over
+#                the assemblable steps (float32, NaN if none)
+#   'switches' - number of branch changes of joint34 (int32)
+#   'coupler'  - DxSx2 coupler points (float32), only if keepcurves
+# branch='track' follows each design's joint34 along its continuous
+# solution (see trackbranch()) starting from assembly, so 'switches'
+# flags designs that pass a change point, where the two solutions
+# meet, without a second validation pass. branch='fixed' uses assembly throughout.
+def solvechunk(params,thetas,joint12,joint15,assembly=0,keepcurves=False,
+               branch='fixed'):
+    params = np.asarray(params,float)
+    thetas = np.asarray(thetas,float)
+    joint12 = np.asarray(joint12,float)
+    joint15 = np.asarray(joint15,float)
+    l2, l3, l4, l5, gearratio, phase, lc, gammac = [params[:,k:k+1]
+                                                   for k in range(8)]
+    numdesigns, numsteps = params.shape[0], thetas.shape[0]
+
+    size = numdesigns*numsteps
+
+    #DxS arrays of input and output crank angles
+    with profilestage('sweep cranks',size):
+        theta2 = np.broadcast_to(thetas,(numdesigns,numsteps))
+        theta5 = phase + theta2/gearratio
+        joints23 = np.stack((joint12[0]+l2*np.cos(theta2),
+                             joint12[1]+l2*np.sin(theta2)),axis=-1).reshape((-1,2))
+        joints45 = np.stack((joint15[0]+l5*np.cos(theta5),
+                             joint15[1]+l5*np.sin(theta5)),axis=-1).reshape((-1,2))
+
+    def persteps(column):
+        return np.repeat(column[:,0],numsteps)
+    with profilestage('sweep dyad',size):
+        intersects, assemblable = circcirc_batch(joints23,persteps(l3),
+                                                 joints45,persteps(l4))
+        if branch == 'track':
+            joints34, _, switched = trackbranch(
+                intersects.reshape((numdesigns,numsteps,2,2)),assembly,
+                thetas=thetas)
+            joints34 = joints34.reshape((-1,2))
+            switches = np.sum(switched,axis=1)
+        else:
+            joints34 = intersects[:,assembly,:]
+            switches = np.zeros(numdesigns)
+    with profilestage('sweep coupler',size):
+        couplerpts = coupler(joints45,joints34,persteps(lc),persteps(gammac))
+        couplerpts = couplerpts.reshape((numdesigns,numsteps,2))
+    assemblable = assemblable.reshape((numdesigns,numsteps))
+
+    results = {}
+    results['valid'] = assemblable.all(axis=1)
+    results['fraction'] = assemblable.mean(axis=1).astype(np.float32)
+    results['switches'] = switches.astype(np.int32)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore',RuntimeWarning)   #all-NaN rows
+        results['bbox'] = np.column_stack(
+            (np.nanmin(couplerpts,axis=1),
+             np.nanmax(couplerpts,axis=1))).astype(np.float32)
+    if keepcurves:
+        results['coupler'] = couplerpts.astype(np.float32)
+    return results
+
+# solvechunk() through a TrajectoryCache (or directly if cache is None)
+def cachedsolvechunk(params,thetas,joint12,joint15,assembly=0,
+                     keepcurves=False,branch='fixed',cache=None):
+    if cache is None:
+        return solvechunk(params,thetas,joint12,joint15,assembly,
+                          keepcurves,branch)
+    key = cachekey(('geared5barsweep',tuple(map(float,joint12)),
+                    tuple(map(float,joint15))),thetas,
+                   params=np.asarray(params,float),assembly=assembly,
+                   keepcurves=keepcurves,branch=branch,backend=get_backend())
+    results = cache.load(key)
+    if results is None:
+        results = solvechunk(params,thetas,joint12,joint15,assembly,
+                             keepcurves,branch)
+        cache.save(key,results)
+    return results
+
+#########################
+# Solve every chunk from chunks (e.g. gridchunks() or arraychunks())
+# over a pool of processes (default: one per core).
+# Generates (start, results) in order, where start is the row of the
+# first design of the chunk and results is the dict of solvechunk().
+# Only the compact result arrays come back from the workers.
+# Chunk results go through the trajectory cache (see getcache() in
+# TrajectoryCache.py for cache), so repeating a sweep loads them
+# instead; cache=False or LINKAGE_CACHE=off solves every chunk.
+# If profiling is on (see Profiling.py), each worker profiles its
+# chunks and the stages are merged into the caller's Profiler.
+def sweep(chunks,thetas,joint12,joint15,assembly=0,keepcurves=False,
+          branch='fixed',processes=None,cache=None):
+    profiler = getprofiler()
+    solver = functools.partial(profiledcall,profiler is not None,
+                               cachedsolvechunk,thetas=np.asarray(thetas,float),
+                               joint12=np.asarray(joint12,float),
+                               joint15=np.asarray(joint15,float),
+                               assembly=assembly,keepcurves=keepcurves,
+                               branch=branch,cache=getcache(cache))
+    pool = multiprocessing.Pool(processes)
+    try:
+        start = 0
+        for results, stages in pool.imap(solver,chunks):
+            if stages:
+                profiler.merge(stages)
+            yield start, results
+            start += results['valid'].shape[0]
+    finally:
+        pool.terminate()
+
+#########################
+if __name__ == '__main__':
+    import sys
+    import time
+    from Profiling import enable
+    profiler = enable() if '--profile' in sys.argv[1:] else None
+    #Sweep link3, link4 and the phase around the design of
+    #InitialJointsGeared5Bar.txt
+    pointsdata = np.loadtxt('InitialJointsGeared5Bar.txt')
+    axes = [[4.1],np.linspace(9.,15.,60),np.linspace(14.,20.,60),[4.8],
+            [-2.,2.,-3.],np.linspace(0.,2*np.pi,36),[8.],[0.3]]
+    thetas = np.linspace(0.,-6.0*np.pi,120)
+    tstart = time.time()
+    numvalid = 0
+    for start, results in sweep(gridchunks(axes,4096),thetas,
+                                pointsdata[0,:],pointsdata[4,:]):
+        numvalid += np.sum(results['valid'])
+    print('%d of %d designs assemblable, %.2f s'
+          % (numvalid,gridsize(axes),time.time()-tstart))
+    if profiler is not None:
+        print(profiler.report())
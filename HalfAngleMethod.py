@@ -19,6 +19,11 @@ from numpy import *
 from matplotlib.pyplot import *
 import os
 
+#Draw all the link snapshots with one LineCollection
+from LinkageRender import drawlinks
+#Vectorized half angle solution, both inversions
+from LinkageUtilities import halfangle
+
 #Define link lengths and inversion
 #(Alternatively one could read initial joint xy locations
 #from a file and use those to get the link lengths)
@@ -40,8 +45,6 @@ numsteps = 24
 
 #array of input crank angles
 theta2s = linspace(theta2start,theta2end,numsteps)
-xca1 = zeros(numsteps,float)          #arrays for the coupler outputs
-yca1 = zeros(numsteps,float)
 
 #Clear figure
 clf()
@@ -58,59 +61,42 @@ axes().set_aspect('equal', 'datalim')  #square and limited by data
 
 
 ################################
-#Main loop for each crank angle
-#numpy counts from zero, not one
-for i in range(0,numsteps):
-
-    cosq2 = cos(theta2s[i])
-    sinq2 = sin(theta2s[i])
-    
-    # Define some substitutions (9.29-9.31)
-    A = 2*R4*(R1 - R2*cosq2)
-    B = -2*R2*R4*sinq2
-    C = R3**2 - R2**2 - R4**2 - R1**2 + 2*R2*R1*cosq2
-    
-    #Solve for the roots of half angle equation (9.35)    
-    #In general
-    u41 = (B + sqrt(A**2 + B**2 - C**2))/(A+C)
-    q4 = 2*arctan(u41)
-    
-    #If inversion
-    if inversion:
-        u42 = (B - sqrt(A**2 + B**2 - C**2))/(A+C)
-        q4 = 2*arctan(u42)
-    
-    #Solve for theta3 (9.37-9.39)
-    #range = -PI to +PI
-    cosq3 = (-R2*cosq2 + R4*cos(q4) + R1)/R3
-    sinq3 = (-R2*sinq2 + R4*sin(q4))/R3
-    q3 = arctan2(sinq3,cosq3)  #don't really need it for plotting
-    
-    #Compute locations of joints 2,3
-    X2 = R2 * cosq2
-    Y2 = R2 * sinq2
-    X3 = X2+R3*cosq3
-    Y3 = Y2+R3*sinq3
-    
-    #Now plot the linkage... 
-    #plot every 2nd step to make less messy 
-    if i%2==0:
-        plot([X1,X2],[Y1,Y2],color = 'g') 
-        plot([X2,X3],[Y2,Y3],color = 'r')
-        plot([X3,X4],[Y3,Y4],color = 'b')
-    
-    #Coupler location 
-    xca1[i] = R2*cos(theta2s[i])+R5*cos(q3+gammac)
-    yca1[i] = R2*sin(theta2s[i])+R5*sin(q3+gammac)
-    
-    #Plot Coupler
-    plot(xca1[i],yca1[i],'*')
+#Solve for all crank angles at once with halfangle(), which
+#follows equations (9.29)-(9.39) and returns both inversions.
+#Each variable below is an array with one entry per crank angle.
+solution = halfangle(theta2s,R1,R2,R3,R4,R5,gammac)
+if not solution['valid'].all():
+    print('Linkage cannot be assembled at some crank angles')
+
+#Pick the inversion
+k = 1 if inversion else 0
+q4 = solution['theta4'][k]
+q3 = solution['theta3'][k]  #don't really need it for plotting
+
+#Locations of joints 2,3
+X2, Y2 = solution['joint2'][:,0], solution['joint2'][:,1]
+X3, Y3 = solution['joint3'][k][:,0], solution['joint3'][k][:,1]
+
+#Now plot the linkage... 
+#plot every 2nd step to make less messy 
+joints = {'1':column_stack((full(numsteps,X1),full(numsteps,Y1))),
+          '2':column_stack((X2,Y2)),
+          '3':column_stack((X3,Y3)),
+          '4':column_stack((full(numsteps,X4),full(numsteps,Y4)))}
+drawlinks(gca(),joints,[('1','2'),('2','3'),('3','4')],
+          every=2,colors=['g','r','b'])
+
+#Coupler location 
+xca1, yca1 = solution['coupler'][k][:,0], solution['coupler'][k][:,1]
+
+#Plot Coupler
+plot(xca1,yca1,'*')
 #   Makes plot kinda messy, but can uncomment if debugging
-#    if i%2==0:
-#        plot([X2,xca1[i]],[Y2,yca1[i]],color='m')
+#joints['c'] = column_stack((xca1,yca1))
+#drawlinks(gca(),joints,[('2','c')],every=2,colors='m')
+
 
-    
-#end for i loop
+#end of solution for all crank angles
 
 
 #Open file for writing the coupler points as X Y values with
@@ -2,8 +2,8 @@
 """
 Created Sept. 19 2015
 @author: markcutkosky
-Example of solving for a Jansen-like linkage using circcirc() and 
-other utilities. The approach is similar to CircCirc4Bar.py, but 
+Example of solving for a Jansen-like linkage described joint by
+joint (see Mechanism.py). The approach is similar to CircCirc4Bar.py, but 
 longer, so you might like to review that example first.
 This Jansen-lite example is from a 2011 report by Amanda Ghassaei
 at Pomona College, who wanted to design a Jansen-like linkage
@@ -12,7 +12,7 @@ http://www.robotee.com/LR/51018_THEO-JANSEN-Details.pdf
 This linkage also has more symmetry than the Jansen linkage
 and re-uses some link lengths, which simplifies the solution some.
 The original Jansen linkage would be solved in the same way, 
-but with a couple more uses of circcirc() for additional joints.
+but with a couple more dyads for additional joints.
 """
 
 # Use numpy and matplotlib for Matlab-like stuff
@@ -20,11 +20,9 @@ import numpy as np
 from matplotlib.pyplot import *   #Lazy syntax...
 import os
 
-#Maybe combine these into a single file LinksUtilities.py ?
-# Import some handy utility functions
-from ArcPoints import arcpoints
-from CircCirc import circcirc
-from CouplerPoint import coupler
+# Import the linkage description and the cached solver
+from Mechanism import Mechanism, compile_mechanism
+from TrajectoryCache import cachedsolve
 
 
 # Set the range of angles that we want the crank
@@ -55,45 +53,44 @@ fp2 = -link1*np.array([np.cos(alpha1),np.sin(alpha1)])
 plot((fp2[0],0.0),(fp2[1],0.0),color='k')     #plot the ground link
 
 
-#Compute crank arc from thetastart to thetaend
-crankpoints = arcpoints(fp1,linka,thetastart,thetaend,numsteps)
-plot(crankpoints[:,0],crankpoints[:,1],color = 'g',linewidth=0.5)
-
-
-#For each crank position, compute joint3 and joint4,
-#i.e., the upper and lower intersections of links 'e' and 'd'
-#In this linkage they are mirror images of each other.
-#joints4 = 1st solution (LHS if traveling to fp2)
-#joints3 = 2nd solution (RHS if traveling to fp2)
-joints3 = np.zeros((numsteps,2),float)
-joints4 = np.zeros((numsteps,2),float)
-for i in range(0,numsteps):   
-    intersects = circcirc(crankpoints[i,:],linke,fp2,linkd)
-    joints4[i,:] = intersects[0,:]
-    joints3[i,:] = intersects[1,:]
+#Describe the linkage (see Mechanism.py), joint by joint:
+#For each crank position, joint3 and joint4 are the upper and
+#lower intersections of links 'e' and 'd'. In this linkage they
+#are mirror images of each other.
+#joint4 = 1st solution (LHS if traveling to fp2)
+#joint3 = 2nd solution (RHS if traveling to fp2)
+#The rigid triangles with linkd create a bent link for which
+#the coupler is joint5. In fact, because fp2 is fixed, it traces
+#an arc like joint3, but phase-shifted by (pi-2.97).
+#Finally the foot: going from joint5 to joint4, we want the
+#intersection on RHS.
+mech = Mechanism('jansenlite',theta0=thetastart)
+mech.ground('fp1',fp1)
+mech.ground('fp2',fp2)
+mech.crank('crank','fp1',linka)
+mech.dyad('joint4','crank',linke,'fp2',linkd,0)
+mech.dyad('joint3','crank',linke,'fp2',linkd,1)
+mech.coupler('joint5','joint3','fp2',linkd,gammad)
+mech.dyad('foot','joint5',linkf,'joint4',linkf,1)
+
+#Solve every crank position from thetastart to thetaend at once.
+#cachedsolve() keeps the result in the trajectory cache (see
+#TrajectoryCache.py), so running the script again loads it instead.
+thetas = np.linspace(thetastart,thetaend,numsteps)
+joints, assemblable = cachedsolve(compile_mechanism(mech),thetas)
+if not assemblable.all():
+    print('Linkage cannot be assembled at %d of the steps' % np.sum(~assemblable))
+crankpoints = joints['crank']
+joints4 = joints['joint4']
+joints3 = joints['joint3']
+joints5 = joints['joint5']
+foots = joints['foot']
 
+plot(crankpoints[:,0],crankpoints[:,1],color = 'g',linewidth=0.5)
 plot(joints3[:,0],joints3[:,1],color = 'g',linewidth=0.5)
 plot(joints4[:,0],joints4[:,1],color = 'g',linewidth=0.5)
-
-
-#Now we can get joints5. The rigid triangles with linkd
-#create a bent link for which the coupler is joint5.
-#In fact, because fp2 is fixed, it traces an arc like
-#joint3, but phase-shifted by (pi-2.97)
-joints5 = np.zeros((numsteps,2),float)
-for i in range(0,numsteps): 
-    joints5[i,:] = coupler(joints3[i,:],fp2,linkd,gammad)
-    
 plot(joints5[:,0],joints5[:,1],color = 'g',linewidth=0.5)
 
-
-#Finally we get the foot location, again using circcirc().
-#Going from joint5 to joint4, we want the intersection on RHS
-foots = np.zeros((numsteps,2),float)
-for i in range(0,numsteps):   
-    intersections = circcirc(joints5[i,:],linkf,joints4[i,:],linkf)
-    foots[i,:] = intersections[1,:]
-
 # Plot foot locations, with big dot at start
 # Note that it's quite fast at top of step.
 plot(foots[:,0],foots[:,1],'.')
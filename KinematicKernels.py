@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Choice of backend for the two kernels every solve spends its time
+in: circle intersection (circcirc_batch()) and coupler points
+(coupler()).
+* 'numpy' - the whole-array versions in LinkageUtilities.py.
+* 'numba' - the same formulas as one compiled loop per kernel, with
+  no temporary arrays. Needs Numba; worth it for long single-design
+  trajectories where the NumPy temporaries (delta, arctan2, arccos,
+  cos, sin...) cost more memory traffic than the arithmetic.
+The functions here have the same arguments and results as those in
+LinkageUtilities.py and call whichever backend is selected, so
+Mechanism.py and Geared5BarSweep.py use them unchanged. Both backends
+give the same results to rounding (NumPy may use vectorized
+cos/sin/arctan2 that differ in the last bit).
+The default backend is 'numpy', or the LINKAGE_BACKEND environment
+variable ('numpy', 'numba' or 'auto': numba when installed). Asking
+for 'numba' without Numba installed falls back to 'numpy' with a
+warning. Numba is only imported once its backend is selected.
+Contents:
+* available_backends(): The backends that can run here.
+* set_backend(), get_backend(): Select / report the backend.
+* usebackend(): Context manager selecting a backend for a block.
+* circcirc_batch(), coupler(): The kernels, on the selected backend.
+
+Example:
+    set_backend('auto')
+    print(get_backend())          #'numba' if installed, else 'numpy'
+    joints, valid = solve(mech,np.linspace(0.,2*np.pi,10**7))
+"""
+
+import os
+import warnings
+import importlib.util
+from contextlib import contextmanager
+import numpy as np
+
+import LinkageUtilities
+
+BACKENDS = ('numpy','numba')
+
+#########################
+# Numba is only imported (and the loops compiled) when the numba
+# backend is selected, so the default numpy backend starts as fast
+# with Numba installed as without.
+def available_backends():
+    if importlib.util.find_spec('numba') is None:
+        return ('numpy',)
+    return BACKENDS
+
+# Select the backend: 'numpy', 'numba' or 'auto' (numba if
+# installed). Returns the backend actually selected.
+def set_backend(name):
+    global _backend
+    if name == 'auto':
+        name = available_backends()[-1]
+    if name not in BACKENDS:
+        raise ValueError('unknown backend %r; use one of %s or auto'
+                         % (name,', '.join(BACKENDS)))
+    if name == 'numba':
+        try:
+            _numbaloops()
+        except ImportError:
+            warnings.warn('numba is not installed; using the numpy backend')
+            name = 'numpy'
+    _backend = name
+    return _backend
+
+def get_backend():
+    return _backend
+
+@contextmanager
+def usebackend(name):
+    previous = _backend
+    set_backend(name)
+    try:
+        yield _backend
+    finally:
+        set_backend(previous)
+
+#########################
+# Compiled loops, following circcirc_batch() and coupler() in
+# LinkageUtilities.py step for step, made on first use. Numba
+# compiles them on their first call and caches the machine code on
+# disk.
+_loops = None
+
+def _numbaloops():
+    global _loops
+    if _loops is not None:
+        return _loops
+    import numba
+
+    @numba.njit(cache=True,error_model='numpy')
+    def _circcircloop(points1,r1,points2,r2,tol,circpoints,assemblable):
+        for i in range(points1.shape[0]):
+            dx = points2[i,0] - points1[i,0]
+            dy = points2[i,1] - points1[i,1]
+            r12sq = dx*dx + dy*dy
+            r12 = np.sqrt(r12sq)
+            cosalpha = (r12sq + r1[i]*r1[i] - r2[i]*r2[i])/(2*r1[i]*r12)
+            ok = (r1[i] >= 0) and (r2[i] >= 0) and (abs(cosalpha) <= 1+tol)
+            assemblable[i] = ok
+            if not ok:
+                circpoints[i,:,:] = np.nan
+                continue
+            alpha1 = np.arccos(min(max(cosalpha,-1.0),1.0))
+            phi = np.arctan2(dy,dx)
+            circpoints[i,0,0] = points1[i,0] + r1[i]*np.cos(phi+alpha1)
+            circpoints[i,0,1] = points1[i,1] + r1[i]*np.sin(phi+alpha1)
+            circpoints[i,1,0] = points1[i,0] + r1[i]*np.cos(phi-alpha1)
+            circpoints[i,1,1] = points1[i,1] + r1[i]*np.sin(phi-alpha1)
+
+    @numba.njit(cache=True,error_model='numpy')
+    def _couplerloop(point1,point2,r,theta,cpoints):
+        for i in range(point1.shape[0]):
+            psi = np.arctan2(point2[i,1]-point1[i,1],
+                             point2[i,0]-point1[i,0]) + theta[i]
+            cpoints[i,0] = point2[i,0] + r[i]*np.cos(psi)
+            cpoints[i,1] = point2[i,1] + r[i]*np.sin(psi)
+
+    _loops = (_circcircloop,_couplerloop)
+    return _loops
+
+_backend = 'numpy'
+set_backend(os.environ.get('LINKAGE_BACKEND','numpy'))
+
+# Broadcast Nx2 points and N-element scalars against each other
+def _broadcast(points,scalars):
+    points = [np.asarray(p,float).reshape((-1,2)) for p in points]
+    scalars = [np.asarray(s,float).reshape(-1) for s in scalars]
+    numsteps = max([p.shape[0] for p in points] + [s.shape[0] for s in scalars])
+    return ([np.broadcast_to(p,(numsteps,2)) for p in points],
+            [np.broadcast_to(s,(numsteps,)) for s in scalars], numsteps)
+
+#########################
+# circcirc_batch() of LinkageUtilities.py on the selected backend
+def circcirc_batch(points1,r1,points2,r2,tol=1e-12):
+    if _backend == 'numpy':
+        return LinkageUtilities.circcirc_batch(points1,r1,points2,r2,tol)
+    (points1, points2), (r1, r2), numsteps = _broadcast((points1,points2),
+                                                        (r1,r2))
+    circpoints = np.empty((numsteps,2,2),float)
+    assemblable = np.empty(numsteps,bool)
+    _numbaloops()[0](points1,r1,points2,r2,tol,circpoints,assemblable)
+    return circpoints, assemblable
+
+# coupler() of LinkageUtilities.py on the selected backend
+def coupler(point1,point2,r,theta):
+    if _backend == 'numpy':
+        return LinkageUtilities.coupler(point1,point2,r,theta)
+    shape = np.broadcast_shapes(np.shape(point1),np.shape(point2),
+                                np.shape(r)+(1,),np.shape(theta)+(1,))
+    (point1, point2), (r, theta), numsteps = _broadcast((point1,point2),
+                                                        (r,theta))
+    cpoints = np.empty((numsteps,2),float)
+    _numbaloops()[1](point1,point2,r,theta,cpoints)
+    return cpoints.reshape(shape)
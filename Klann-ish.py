@@ -23,9 +23,9 @@ from matplotlib.pyplot import *   #Lazy syntax...
 import os
 
 # Import some handy utility functions
-from ArcPoints import arcpoints
 from CircCirc import circcirc
-from CouplerPoint import coupler
+from Mechanism import Mechanism, compile_mechanism
+from TrajectoryCache import cachedsolve
 
 # Read the initial joint locations from a file.
 # First check if in right directory...
@@ -103,32 +103,56 @@ gamma5 = gamma2-gamma1
 # This determines which "assembly" we have.
 intersections = circcirc(joint23,l3,joint14,l4)
 if(np.allclose(intersections[0],joint34)):
-    assembly = 0
+    assembly34 = 0
 elif(np.allclose(intersections[1],joint34)):
-    assembly = 1
+    assembly34 = 1
+else:
+    print('Hmmm, neither solution matches the input point...')
+
+# Same for joint56, which comes after joint36 (treated as a
+# coupler point on link3) going towards the output of the mechanism.
+intersections = circcirc(joint36,l6,joint15,l5)
+if(np.allclose(intersections[0],joint56)):
+    assembly56 = 0
+elif(np.allclose(intersections[1],joint56)):
+    assembly56 = 1
 else:
     print('Hmmm, neither solution matches the input point...')
 
 
-# Use Arcpoints() to get all the positions of joint23,
-# as input crank goes from thetastart to thetaend
-joints23 = arcpoints(joint12,l2,thetastart,thetaend,numsteps)
-# Plot them, with dot at start and square at end:
+# Describe the linkage with these lengths and assemblies
+# (see Mechanism.py), from the input crank to the foot.
+mech = Mechanism('klann')
+mech.ground('joint12',joint12)
+mech.ground('joint14',joint14)
+mech.ground('joint15',joint15)
+mech.crank('joint23','joint12',l2)
+mech.dyad('joint34','joint23',l3,'joint14',l4,assembly34)
+mech.coupler('joint36','joint23','joint34',c3,gamma3)
+mech.dyad('joint56','joint36',l6,'joint15',l5,assembly56)
+mech.coupler('foot','joint56','joint36',c5,gamma5)
+
+# Solve all the positions as the input crank goes from thetastart
+# to thetaend in one call. cachedsolve() keeps the result in the
+# trajectory cache (see TrajectoryCache.py), so running the script
+# again loads it instead. It also tells us at which steps the
+# linkage can't be assembled.
+thetas = np.linspace(thetastart,thetaend,numsteps)
+joints, assemblable = cachedsolve(compile_mechanism(mech),thetas)
+if not assemblable.all():
+    print('Linkage cannot be assembled at %d of the steps' % np.sum(~assemblable))
+joints23 = joints['joint23']
+joints34 = joints['joint34']
+joints36 = joints['joint36']
+joints56 = joints['joint56']
+foots = joints['foot']
+
+
+# Plot joint23, with dot at start and square at end:
 plot(joints23[:,0],joints23[:,1],color = 'g',linewidth=0.5)
 plot(joints23[0,0],joints23[0,1],'o')
 plot(joints23[numsteps-1,0],joints23[numsteps-1,1],'s')
 
-
-# Compute all the locations of joint34 and joint36, treating
-# joint36 as a coupler point
-joints34 = np.zeros((numsteps,2),float)
-joints36 = np.zeros((numsteps,2),float)
-for i in range(0,numsteps):   
-    intersections = circcirc(joints23[i,:],l3,joint14,l4)
-    joints34[i,:] = intersections[assembly,:]
-    joints36[i,:] = coupler(joints23[i,:],joints34[i,:],c3,gamma3)
-
-
 # If desired, plot joint34 locations, with dot at start and square at end:
 #plot(joints34[:,0],joints34[:,1],color = 'g',linewidth=0.5)
 #plot(joints34[0,0],joints34[0,1],'o')
@@ -140,31 +164,6 @@ plot(joints36[0,0],joints36[0,1],'o')
 plot(joints36[numsteps-1,0],joints36[numsteps-1,1],'s')   
 
 
-#### Repeat the process above for the output of the mechanism
-###  starting with locations of joint36 which we now know.
-
-# Use circcirc() to solve for the initial location
-# of joint56. One of the two solutions returned
-# will match the actual initial position.
-# This determines which "assembly" we have.
-intersections = circcirc(joint36,l6,joint15,l5)
-if(np.allclose(intersections[0],joint56)):
-    assembly = 0
-elif(np.allclose(intersections[1],joint56)):
-    assembly = 1
-else:
-    print('Hmmm, neither solution matches the input point...')
-    
-    
-# Compute all the locations of joint56 and foot
-joints56 = np.zeros((numsteps,2),float)
-foots = np.zeros((numsteps,2),float)
-for i in range(0,numsteps):   
-    intersections = circcirc(joints36[i,:],l6,joint15,l5)
-    joints56[i,:] = intersections[assembly,:]
-    foots[i,:] = coupler(joints56[i,:],joints36[i,:],c5,gamma5)
-
-
 # Plot joint56 locations, with dot at start and square at end:
 plot(joints56[:,0],joints56[:,1],color = 'g',linewidth=0.5)
 plot(joints56[0,0],joints56[0,1],'o')
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+Toggle (dead-centre) positions, rocker limit positions, worst
+transmission angles and the range of input angles over which a
+mechanism can be assembled, found to machine precision by root
+finding instead of by sampling millions of steps and looking for
+NaNs or jumps.
+For every dyad of a compiled plan (see Mechanism.py), at distance
+r1 from joint1 and r2 from joint2, with r12 the distance between
+joint1 and joint2, the events are roots of:
+  'toggle-extended'  r12 - (r1+r2)    links stretched out in line
+  'toggle-folded'    r12 - |r1-r2|    links folded back in line
+      (circcirc() stops intersecting past either one)
+  'limit'            (joint - pivot) x d(joint)/d(theta), for a dyad
+      hinged to a ground pivot: the rocker stops and turns back
+and the transmission angle mu between the dyad's two links (90
+degrees is best, 0 or 180 a toggle) has its worst values where
+|sin(mu)| has a local minimum.
+One period of the input (inputperiod()) is sampled coarsely to
+bracket every sign change, then all brackets are refined together
+by the Illinois (modified regula falsi) method, one vectorized
+solve per iteration, using the analytic derivatives of
+solve_plan(). Roots closer together than the sampling step, and
+grazing contacts that don't change sign, can be missed.
+Contents:
+* eventfunctions(): The event functions of every dyad at given
+  input angles.
+* limitpositions(): Find all events in one period, the worst
+  transmission angles and the assemblable input intervals.
+* printreport(): Print the result of limitpositions().
+
+Usage:
+  python LimitPositions.py klann
+"""
+
+import sys
+import numpy as np
+
+from Mechanism import compile_mechanism, solve_plan, inputperiod
+
+EVENTKINDS = ('toggle-extended','toggle-folded','limit')
+
+def _cross(a,b):
+    return a[...,0]*b[...,1] - a[...,1]*b[...,0]
+
+#########################
+# Event functions of every dyad of plan at input angles thetas.
+# Returns values, a dict (dyad name, kind) -> N array for the kinds
+# in EVENTKINDS and
+#   'transmission' - sign(sin(mu))*d(sin(mu))/d(theta), going from
+#                    - to + at local minima of |sin(mu)|
+#   'mu'           - transmission angle, 0..pi
+# and valid from solve_plan().
+def eventfunctions(plan,thetas):
+    derivatives = {}
+    joints, valid = solve_plan(plan,thetas,derivatives=derivatives)
+    velocity = derivatives['velocity']
+    grounds = set(stage[1] for stage in plan if stage[0] == 'ground')
+    values = {}
+    with np.errstate(invalid='ignore'):
+        for stage in plan:
+            if stage[0] != 'dyad':
+                continue
+            name, joint1, r1, joint2, r2 = stage[1:6]
+            point = joints[name]
+            a = joints[joint1] - point
+            b = joints[joint2] - point
+            r12 = np.hypot(*np.moveaxis(joints[joint2]-joints[joint1],-1,0))
+            values[(name,'toggle-extended')] = r12 - (r1+r2)
+            values[(name,'toggle-folded')] = r12 - abs(r1-r2)
+            pivots = [j for j in (joint1,joint2) if j in grounds]
+            if len(pivots) == 1:
+                values[(name,'limit')] = _cross(point-joints[pivots[0]],
+                                                velocity[name])
+            sinmu = _cross(a,b)/(r1*r2)
+            dsinmu = (_cross(velocity[joint1]-velocity[name],b)
+                      + _cross(a,velocity[joint2]-velocity[name]))/(r1*r2)
+            values[(name,'transmission')] = np.sign(sinmu)*dsinmu
+            values[(name,'mu')] = np.arctan2(np.abs(sinmu),
+                                             np.sum(a*b,axis=-1)/(r1*r2))
+    return values, valid
+
+#########################
+# Refine the roots of the event functions keys[i] bracketed by
+# lo[i], hi[i] (with values flo, fhi of opposite sign) together.
+# Returns the roots (NaN where a bracket failed), the function
+# values there and the number of solves used.
+def _refine(plan,keys,lo,hi,flo,fhi,maxiter=100):
+    lo, hi, flo, fhi = [np.array(x,float) for x in (lo,hi,flo,fhi)]
+    numroots = lo.shape[0]
+    side = np.zeros(numroots,int)      #end that moved last: -1 lo, 1 hi
+    active = np.ones(numroots,bool)
+    roots = np.full(numroots,np.nan)
+    froots = np.full(numroots,np.nan)
+    solves = 0
+    for iteration in range(maxiter):
+        if not active.any():
+            break
+        with np.errstate(invalid='ignore',divide='ignore'):
+            guess = (lo*fhi - hi*flo)/(fhi-flo)
+        bad = ~np.isfinite(guess) | (guess <= lo) | (guess >= hi)
+        guess = np.where(bad,0.5*(lo+hi),guess)
+
+        index = np.flatnonzero(active)
+        values, valid = eventfunctions(plan,guess[index])
+        solves += 1
+        g = np.full(numroots,np.nan)
+        g[index] = [values[keys[i]][n] for n,i in enumerate(index)]
+
+        moved = active & np.isfinite(g)
+        uselo = moved & (np.sign(g) == np.sign(flo))
+        usehi = moved & ~uselo
+        #Illinois: halve the value at an end that stays put twice
+        fhi = np.where(uselo & (side == -1),0.5*fhi,fhi)
+        flo = np.where(usehi & (side == 1),0.5*flo,flo)
+        lo = np.where(uselo,guess,lo)
+        flo = np.where(uselo,g,flo)
+        hi = np.where(usehi,guess,hi)
+        fhi = np.where(usehi,g,fhi)
+        side = np.where(uselo,-1,np.where(usehi,1,side))
+
+        tol = 2*np.finfo(float).eps*np.maximum(1.0,np.abs(guess))
+        done = moved & ((g == 0) | (hi-lo <= tol))
+        roots = np.where(done,guess,roots)
+        froots = np.where(done,g,froots)
+        active &= ~done & np.isfinite(g)
+    return roots, froots, solves
+
+#########################
+# Find the events of every dyad of plan over one period of the
+# input from thetastart (period defaults to inputperiod(plan), or
+# 2*pi), bracketing them with numsamples steps. Returns a dict:
+#   'events'       - list of dicts with 'joint', 'kind' (one of
+#                    EVENTKINDS) and 'theta', in order of theta
+#   'transmission' - list of dicts with 'joint', 'theta' and 'mu' at
+#                    each local minimum of |sin(mu)|, in order of theta
+#   'worst'        - dict joint -> the entry of 'transmission' with
+#                    mu furthest from 90 degrees, for each dyad
+#   'intervals'    - list of (start, end) input angles between which
+#                    every dyad can be assembled (one that wraps past
+#                    the end of the period ends after it)
+#   'fullrange'    - True if it can be assembled at every angle
+#   'period', 'thetastart', 'solves' (number of solve_plan() calls)
+def limitpositions(plan,numsamples=360,thetastart=0.0,period=None,
+                   maxiter=100):
+    if period is None:
+        period = inputperiod(plan) or 2*np.pi
+    thetas = thetastart + period*np.arange(numsamples+1)/float(numsamples)
+    values, valid = eventfunctions(plan,thetas)
+    solves = 1
+
+    #Brackets: sign changes between samples (exact zeros count too)
+    keys, lo, hi, flo, fhi = [], [], [], [], []
+    exact = []
+    for key in values:
+        if key[1] not in EVENTKINDS and key[1] != 'transmission':
+            continue
+        f = values[key]
+        f0, f1 = f[:-1], f[1:]
+        with np.errstate(invalid='ignore'):
+            change = np.isfinite(f0) & np.isfinite(f1) & (f0*f1 < 0)
+            if key[1] == 'transmission':
+                change &= (f0 < 0)           #minima only
+            else:
+                exact.extend((key,thetas[i]) for i in np.flatnonzero(f0 == 0))
+        for i in np.flatnonzero(change):
+            keys.append(key)
+            lo.append(thetas[i])
+            hi.append(thetas[i+1])
+            flo.append(f0[i])
+            fhi.append(f1[i])
+    roots, froots, refinesolves = _refine(plan,keys,lo,hi,flo,fhi,maxiter)
+    solves += refinesolves
+
+    #Keep real roots, not sign changes through infinity at a toggle
+    scale = np.maximum(np.abs(flo),np.abs(fhi)) if keys else np.zeros(0)
+    events, transmission = [], []
+    found = [(key,theta) for key,theta,froot,s in zip(keys,roots,froots,scale)
+             if np.isfinite(theta) and abs(froot) <= 1e-6*s] + exact
+    for key, theta in found:
+        if key[1] != 'transmission':
+            events.append({'joint':key[0],'kind':key[1],'theta':float(theta)})
+    minima = [(key,theta) for key,theta in found if key[1] == 'transmission']
+    if minima:
+        at = np.array([theta for key,theta in minima])
+        mvalues, _ = eventfunctions(plan,at)
+        solves += 1
+        for n, (key, theta) in enumerate(minima):
+            transmission.append({'joint':key[0],'theta':float(theta),
+                                 'mu':float(mvalues[(key[0],'mu')][n])})
+    events.sort(key=lambda event: event['theta'])
+    transmission.sort(key=lambda entry: entry['theta'])
+    worst = {}
+    for entry in transmission:
+        current = worst.get(entry['joint'])
+        if current is None or (abs(entry['mu']-np.pi/2)
+                               > abs(current['mu']-np.pi/2)):
+            worst[entry['joint']] = entry
+
+    #Assemblable intervals, split at the toggles
+    cuts = sorted(set([thetastart,thetastart+period]
+                      + [event['theta'] for event in events
+                         if event['kind'] != 'limit']))
+    cuts = np.array(cuts)
+    middle = 0.5*(cuts[:-1]+cuts[1:])
+    _, middlevalid = solve_plan(plan,middle)
+    solves += 1
+    intervals = []
+    for start, end, ok in zip(cuts[:-1],cuts[1:],middlevalid):
+        if not ok:
+            continue
+        if intervals and intervals[-1][1] == start:
+            intervals[-1] = (intervals[-1][0],float(end))
+        else:
+            intervals.append((float(start),float(end)))
+    fullrange = (len(intervals) == 1 and intervals[0][0] == thetastart
+                 and intervals[0][1] == thetastart+period)
+    if (not fullrange and len(intervals) > 1 and intervals[0][0] == thetastart
+            and intervals[-1][1] == thetastart+period):
+        first = intervals.pop(0)
+        intervals[-1] = (intervals[-1][0],first[1]+period)
+    return {'events':events,'transmission':transmission,'worst':worst,
+            'intervals':intervals,'fullrange':fullrange,'period':period,
+            'thetastart':thetastart,'solves':solves}
+
+# Print the result of limitpositions(), angles in degrees
+def printreport(result):
+    print('Input period %.6g deg, %d solves'
+          % (np.degrees(result['period']),result['solves']))
+    for event in result['events']:
+        print('  %-16s %-10s at theta = %.12g deg'
+              % (event['kind'],event['joint'],np.degrees(event['theta'])))
+    for joint in sorted(result['worst']):
+        entry = result['worst'][joint]
+        print('  worst transmission angle at %-10s %.6g deg, theta = %.12g deg'
+              % (joint,np.degrees(entry['mu']),np.degrees(entry['theta'])))
+    if result['fullrange']:
+        print('  assemblable at every input angle')
+    for start, end in (() if result['fullrange'] else result['intervals']):
+        print('  assemblable from %.12g to %.12g deg'
+              % (np.degrees(start),np.degrees(end)))
+
+#########################
+if __name__ == '__main__':
+    from MechanismExamples import buildexample
+    for name in (sys.argv[1:] or ['fourbar','geared5bar','klann','jansenlite']):
+        print(name)
+        printreport(limitpositions(compile_mechanism(buildexample(name))))
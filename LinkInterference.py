@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Link-to-link interference over a whole solved cycle, instead of
+looking for crossing links in the plots.
+Each link is the segment between two joints (see planlinks() in
+Mechanism.py), or a capsule: every point within radius of the
+segment. The clearance of two links at a step is the distance
+between their segments less both radii, negative where they
+overlap. Links sharing a joint always touch there and are not
+tested against each other.
+All pairs are tested at all steps as whole-array operations in two
+phases. The broad phase works out, for every pair and step, the gap
+between the bounding boxes of the two segments, a lower bound on
+their distance. The exact segment-to-segment distance is then only
+computed where that bound could give the smallest clearance of the
+pair, or a collision: at the step with the smallest bound, and
+wherever the bound is below the clearance found there. So the
+minimum clearance and the colliding steps are exact, while links
+that stay well apart cost little more than the box test.
+Contents:
+* segmentdistance(): Distance between segments, batched.
+* linkpairs(): The pairs of links to test.
+* interference(): Minimum clearance and colliding steps of every
+  pair of links over solved joint paths.
+* ClearanceMetrics: Consumer for solve_chunks() accumulating the
+  minimum clearance of every pair over a long run.
+* printreport(): Print the result of interference().
+
+Example:
+    plan = compile_mechanism(buildexample('klann'))
+    thetas = cyclethetas(plan,0.,360)
+    joints, valid = solve_plan(plan,thetas)
+    result = interference(joints,planlinks(plan),radius=0.5)
+    for (i, j), clearance in zip(result['pairs'],result['clearance']):
+        ...
+
+Usage:
+  python LinkInterference.py klann [radius]
+"""
+
+import sys
+import numpy as np
+
+from Mechanism import compile_mechanism, solve_plan, cyclethetas, planlinks
+
+def _dot(a,b):
+    return a[...,0]*b[...,0] + a[...,1]*b[...,1]
+
+#########################
+# Distance between the segments p1-q1 and p2-q2 (...x2 arrays that
+# broadcast together), from the closest points of the two segments
+# (parameters s and t along them, clamped to the segments). Crossing
+# segments give 0; zero-length segments are points.
+def segmentdistance(p1,q1,p2,q2):
+    d1 = q1 - p1
+    d2 = q2 - p2
+    r = p1 - p2
+    a = _dot(d1,d1)
+    e = _dot(d2,d2)
+    b = _dot(d1,d2)
+    c = _dot(d1,r)
+    f = _dot(d2,r)
+    denom = a*e - b*b
+    with np.errstate(invalid='ignore',divide='ignore'):
+        #closest point of the infinite lines, s clamped (0 if parallel)
+        s = np.where(denom > 1e-12*a*e,np.clip((b*f-c*e)/denom,0.,1.),0.)
+        t = np.where(e > 0,(b*s+f)/e,-1.)     #a point: its own t = 0
+        #t off the segment: clamp it and take the closest s for it
+        sfort0 = np.where(a > 0,np.clip(-c/a,0.,1.),0.)
+        sfort1 = np.where(a > 0,np.clip((b-c)/a,0.,1.),0.)
+    s = np.where(t < 0,sfort0,np.where(t > 1,sfort1,s))
+    t = np.clip(t,0.,1.)
+    gap = r + d1*s[...,None] - d2*t[...,None]
+    return np.hypot(gap[...,0],gap[...,1])
+
+# Pairs (i, j), i < j, of links (joint, joint) that don't share a
+# joint, so can collide.
+def linkpairs(links):
+    pairs = []
+    for i in range(len(links)):
+        for j in range(i+1,len(links)):
+            if not set(links[i]) & set(links[j]):
+                pairs.append((i,j))
+    return pairs
+
+#########################
+# Clearance between links over solved paths. joints is a dict of
+# ...xNx2 arrays (N steps; leading axes, e.g. designs of a sweep,
+# are kept), links a list of (joint, joint) pairs, radius one
+# capsule radius for all links or one per link. pairs defaults to
+# linkpairs(links); give a shorter list to skip links that work in
+# different layers. A step collides where the clearance is below
+# mindistance. Steps that can't be assembled (NaN joints) are
+# ignored. Returns a dict:
+#   'pairs'     - the (i, j) link index pairs tested
+#   'clearance' - ...xP minimum clearance of each pair (NaN if no
+#                 step can be assembled)
+#   'step'      - ...xP step where it is smallest
+#   'colliding' - ...xPxN True at the steps where the pair collides
+#   'tested'    - number of exact distances computed, of
+#   'total'     - pairs times steps
+def interference(joints,links,radius=0.0,pairs=None,mindistance=0.0):
+    if pairs is None:
+        pairs = linkpairs(links)
+    first = np.asarray(joints[links[0][0]],float)
+    lead, numsteps = first.shape[:-2], first.shape[-2]
+    def ends(k):
+        return np.stack([np.asarray(joints[link[k]],float).reshape((-1,numsteps,2))
+                         for link in links])            #LxDxNx2
+    starts, stops = ends(0), ends(1)
+    radius = np.broadcast_to(np.asarray(radius,float),(len(links),))
+    numpairs = len(pairs)
+    index1 = np.array([i for i,j in pairs],int)
+    index2 = np.array([j for i,j in pairs],int)
+    radii = radius[index1] + radius[index2]
+    shape = (numpairs,) + starts.shape[1:3]             #PxDxN
+
+    #Broad phase: box gaps, less the radii, bound the clearance below
+    lo = np.minimum(starts,stops)
+    hi = np.maximum(starts,stops)
+    with np.errstate(invalid='ignore'):
+        boxgap = np.maximum(np.maximum(lo[index2]-hi[index1],
+                                       lo[index1]-hi[index2]),0.)
+    bound = np.hypot(boxgap[...,0],boxgap[...,1]) - radii[:,None,None]
+    bound = np.where(np.isnan(bound),np.inf,bound)
+
+    #Exact clearance at the smallest bound, then wherever it could be beaten
+    def clearance(p,d,n):
+        i, j = index1[p], index2[p]
+        return (segmentdistance(starts[i,d,n],stops[i,d,n],
+                                starts[j,d,n],stops[j,d,n]) - radii[p])
+    p, d = np.indices(shape[:2]).reshape((2,-1))
+    n = np.argmin(bound,axis=-1).reshape(-1)
+    upper = clearance(p,d,n).reshape(shape[:2])
+    with np.errstate(invalid='ignore'):
+        candidates = bound <= np.fmax(upper,mindistance)[...,None]
+    candidates[p,d,n] = True                            #bound may round above
+    p, d, n = np.nonzero(candidates)
+    exact = np.full(shape,np.inf)
+    exact[p,d,n] = clearance(p,d,n)
+    exact = np.where(np.isnan(exact),np.inf,exact)
+
+    step = np.argmin(exact,axis=-1)
+    smallest = np.take_along_axis(exact,step[...,None],axis=-1)[...,0]
+    smallest = np.where(np.isinf(smallest),np.nan,smallest)
+    def keeplead(x):
+        x = np.moveaxis(x,0,1)                          #DxPx...
+        return x.reshape(lead+x.shape[1:])
+    return {'pairs':pairs,'clearance':keeplead(smallest),
+            'step':keeplead(step),'colliding':keeplead(exact < mindistance),
+            'tested':int(p.shape[0])+numpairs*shape[1],
+            'total':int(np.prod(shape))}
+
+#########################
+# Callable consumer for consume(), for runs too long to keep all
+# joints: interference() on each chunk, keeping for every pair the
+# minimum clearance, the input angle where it occurs and the number
+# of colliding steps.
+class ClearanceMetrics(object):
+
+    def __init__(self,links,radius=0.0,pairs=None,mindistance=0.0):
+        self.links = links
+        self.radius = radius
+        self.pairs = linkpairs(links) if pairs is None else pairs
+        self.mindistance = mindistance
+        self.clearance = np.full(len(self.pairs),np.nan)
+        self.theta = np.full(len(self.pairs),np.nan)
+        self.numcolliding = np.zeros(len(self.pairs),int)
+
+    def __call__(self,start,thetas,joints,valid):
+        result = interference(joints,self.links,self.radius,self.pairs,
+                              self.mindistance)
+        clearance = result['clearance']
+        better = ~(clearance >= self.clearance) & ~np.isnan(clearance)
+        self.clearance = np.where(better,clearance,self.clearance)
+        self.theta = np.where(better,thetas[result['step']],self.theta)
+        self.numcolliding += np.sum(result['colliding'],axis=-1)
+
+# Print the result of interference() for links, closest pairs first
+def printreport(result,links,thetas=None):
+    order = np.argsort(result['clearance'])
+    for k in order:
+        i, j = result['pairs'][k]
+        step = result['step'][k]
+        colliding = np.flatnonzero(result['colliding'][k])
+        print('  %-24s %-24s clearance %10.4g at step %d%s%s'
+              % ('-'.join(links[i]),'-'.join(links[j]),
+                 result['clearance'][k],step,
+                 '' if thetas is None else ' (theta %.4g)' % thetas[step],
+                 ', collides at %d steps' % len(colliding) if len(colliding)
+                 else ''))
+    print('  %d of %d pair-steps needed the exact test'
+          % (result['tested'],result['total']))
+
+#########################
+if __name__ == '__main__':
+    from MechanismExamples import buildexample
+    name = sys.argv[1] if len(sys.argv) > 1 else 'klann'
+    radius = float(sys.argv[2]) if len(sys.argv) > 2 else 0.0
+    mech = buildexample(name)
+    plan = compile_mechanism(mech)
+    thetas = cyclethetas(plan,mech.theta0,360)
+    joints, valid = solve_plan(plan,thetas)
+    links = planlinks(plan)
+    print('%s, %d links, capsule radius %g, %d steps'
+          % (name,len(links),radius,thetas.shape[0]))
+    printreport(interference(joints,links,radius),links,thetas)
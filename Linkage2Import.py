@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Read .linkage2 files from the Linkage design program (as
+GearedFiveBar.linkage2) straight into Mechanism descriptions (see
+Mechanism.py), instead of copying connector coordinates into an
+InitialJoints*.txt file by hand.
+A .linkage2 file has:
+  <connector id x y [anchor] [input rpm] [draw]/>  - joints; anchors
+      are fixed, an input anchor turns the links on it at rpm.
+  <Link id [gear]> <connector id/>... </Link>      - rigid links with
+      two or more connectors.
+  <ratios><ratio type="gears"><link id size/>...    - meshing gears:
+      each gear link turns -size1/size2 times as fast as the other.
+Joints are named 'connector<id>'. Every connector on a link through
+an input anchor becomes a crank about it, every connector on a gear
+link meshing with a turning one becomes a gear about its anchor, and
+the rest are solved as dyads (two links, one known joint on each)
+or coupler points (on a link with two known joints), with the
+assembly seen in the file. The input angle theta0 is the angle of
+the first input link as drawn. Further inputs turn at their rpm
+relative to the first. Sliders are not supported.
+Contents:
+* parselinkage2(): The connectors, links and gear ratios of a file.
+* linkage2mechanism(): Turn a parsed file into a Mechanism.
+* loadlinkage2(): parselinkage2() and linkage2mechanism() together.
+* loaddirectory(): Load every .linkage2 file of a directory.
+
+Example:
+    mech = loadlinkage2('GearedFiveBar.linkage2')
+    plan = compile_mechanism(mech)
+    joints, valid = solve_plan(plan,cyclethetas(plan,mech.theta0,240))
+    couplerpath = joints['connector6']
+"""
+
+import os
+import glob
+import multiprocessing
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+
+from Mechanism import Mechanism
+from LinkageUtilities import polar
+from MechanismExamples import findassembly
+
+#########################
+# Parse a .linkage2 file into a dict:
+#   'connectors' - id -> dict with 'x', 'y', 'anchor', 'input',
+#                  'rpm', 'draw' (in file order)
+#   'links'      - list of dicts with 'id', 'connectors' (ids) and
+#                  'gear'
+#   'gears'      - list of gear pairs, each a list of (link id, size)
+#   'units'      - drawing units, e.g. 'Millimeters'
+# Raises ValueError, naming the file and element, for missing or
+# malformed attributes and for links or gears referring to unknown
+# connectors or links.
+def parselinkage2(filename):
+    root = ElementTree.parse(filename).getroot()
+    if root.tag != 'linkage2':
+        raise ValueError('%s is not a .linkage2 file' % (filename,))
+    def flag(element,name):
+        return element.get(name,'false').lower() == 'true'
+    def bad(element,message):
+        return ValueError('%s: <%s id=%r>: %s' % (filename,element.tag,
+                                                   element.get('id'),message))
+    def text(element,name):
+        value = element.get(name)
+        if value is None:
+            raise bad(element,'no %s' % name)
+        return value
+    def number(element,name,default=None):
+        value = element.get(name)
+        if value is None and default is not None:
+            return default
+        value = text(element,name)
+        try:
+            return float(value)
+        except ValueError:
+            raise bad(element,'%s=%r is not a number' % (name,value))
+
+    connectors = {}
+    links = []
+    gears = []
+    for element in root.findall('connector'):
+        if flag(element,'slider'):
+            raise ValueError('%s: sliders are not supported' % (filename,))
+        connectors[text(element,'id')] = {
+            'x':number(element,'x'),'y':number(element,'y'),
+            'anchor':flag(element,'anchor'),'input':flag(element,'input'),
+            'rpm':number(element,'rpm',0.0),'draw':flag(element,'draw')}
+    for element in root.findall('Link'):
+        ids = [text(c,'id') for c in element.findall('connector')]
+        unknown = [cid for cid in ids if cid not in connectors]
+        if unknown:
+            raise bad(element,'unknown connectors %s' % ', '.join(unknown))
+        links.append({'id':text(element,'id'),'gear':flag(element,'gear'),
+                      'connectors':ids})
+    linkids = set(link['id'] for link in links)
+    for ratio in root.findall('ratios/ratio'):
+        if ratio.get('type') == 'gears':
+            pair = [(text(link,'id'),number(link,'size'))
+                    for link in ratio.findall('link')]
+            if len(pair) != 2:
+                raise bad(ratio,'a gear ratio needs 2 links, not %d' % len(pair))
+            for (lid, size), link in zip(pair,ratio.findall('link')):
+                if lid not in linkids:
+                    raise bad(link,'no such link')
+                if not size > 0:
+                    raise bad(link,'gear size must be positive')
+            gears.append(pair)
+    program = root.find('program')
+    units = program.get('units','') if program is not None else ''
+    return {'connectors':connectors,'links':links,'gears':gears,'units':units}
+
+#########################
+# Build a Mechanism from the dict of parselinkage2(). Raises
+# ValueError if some connector can't be reached from the anchors
+# and inputs by cranks, gears, dyads and coupler points.
+def linkage2mechanism(model,name=''):
+    connectors = model['connectors']
+    links = model['links']
+    def jointname(cid):
+        return 'connector'+cid
+    def point(cid):
+        return np.array([connectors[cid]['x'],connectors[cid]['y']])
+
+    inputs = [cid for cid in connectors
+              if connectors[cid]['input'] and connectors[cid]['anchor']]
+    if not inputs:
+        raise ValueError('%s: no input anchor' % (name or 'linkage',))
+    inputlinks = [link for link in links if inputs[0] in link['connectors']]
+    if not inputlinks:
+        raise ValueError('%s: the input is not on a link' % (name or 'linkage',))
+    other = [cid for cid in inputlinks[0]['connectors'] if cid != inputs[0]][0]
+    theta0, _ = polar(point(inputs[0]),point(other))
+    mech = Mechanism(name,theta0=theta0)
+
+    solved = set()
+    for cid in connectors:
+        if connectors[cid]['anchor']:
+            mech.ground(jointname(cid),point(cid))
+            solved.add(cid)
+
+    # Links turning about an anchor: link id -> (anchor, driver joint)
+    turning = {}
+    def turnlink(link,anchor,phasefor):
+        for cid in link['connectors']:
+            if cid == anchor:
+                continue
+            if cid in solved:
+                raise ValueError('connector %s is both fixed and turning' % cid)
+            angle, radius = polar(point(anchor),point(cid))
+            phasefor(jointname(cid),radius,angle)
+            solved.add(cid)
+        driver = [cid for cid in link['connectors'] if cid != anchor]
+        turning[link['id']] = (anchor,driver[0] if driver else None)
+
+    #Input cranks; other inputs turn at their rpm relative to the first
+    inputrpm = connectors[inputs[0]]['rpm'] or 1.0
+    for cid in inputs:
+        ratio = (connectors[cid]['rpm'] or inputrpm)/inputrpm
+        for link in links:
+            if cid in link['connectors'] and link['id'] not in turning:
+                turnlink(link,cid,lambda joint,radius,angle:
+                         mech.crank(joint,jointname(cid),radius,
+                                    angle-ratio*theta0,ratio))
+
+    #Gears meshing with turning links, until no more can be added
+    linksbyid = dict((link['id'],link) for link in links)
+    added = True
+    while added:
+        added = False
+        for pair in model['gears']:
+            for (driverid, driversize), (gearid, gearsize) in (pair,pair[::-1]):
+                if driverid not in turning or gearid in turning:
+                    continue
+                driveranchor, driver = turning[driverid]
+                gearlink = linksbyid[gearid]
+                anchors = [cid for cid in gearlink['connectors']
+                           if connectors[cid]['anchor']]
+                if driver is None or not anchors:
+                    continue
+                driverstart, _ = polar(point(driveranchor),point(driver))
+                gearratio = -gearsize/driversize
+                turnlink(gearlink,anchors[0],lambda joint,radius,angle:
+                         mech.gear(joint,jointname(anchors[0]),radius,
+                                   jointname(driver),gearratio,angle,
+                                   driverstart))
+                added = True
+
+    #Everything else: coupler points and dyads
+    pending = [cid for cid in connectors if cid not in solved]
+    while pending:
+        progress = False
+        for cid in pending:
+            known = [[k for k in link['connectors'] if k in solved]
+                     for link in links if cid in link['connectors']]
+            rigid = [k for k in known if len(k) >= 2]
+            if rigid:
+                joint1, joint2 = rigid[0][0], rigid[0][1]
+                direction, _ = polar(point(joint1),point(joint2))
+                angle, r = polar(point(joint2),point(cid))
+                mech.coupler(jointname(cid),jointname(joint1),jointname(joint2),
+                             r,angle-direction)
+            else:
+                ends = [k[0] for k in known if k]
+                ends = [k for i, k in enumerate(ends) if k not in ends[:i]]
+                if len(ends) < 2:
+                    continue
+                joint1, joint2 = ends[0], ends[1]
+                r1 = np.linalg.norm(point(cid)-point(joint1))
+                r2 = np.linalg.norm(point(cid)-point(joint2))
+                mech.dyad(jointname(cid),jointname(joint1),r1,jointname(joint2),
+                          r2,findassembly(point(joint1),r1,point(joint2),r2,
+                                          point(cid)))
+            solved.add(cid)
+            progress = True
+        pending = [cid for cid in pending if cid not in solved]
+        if not progress:
+            raise ValueError('%s: cannot solve connectors %s'
+                             % (name or 'linkage',', '.join(pending)))
+    return mech
+
+#########################
+# Load a .linkage2 file as a Mechanism named after the file
+def loadlinkage2(filename):
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return linkage2mechanism(parselinkage2(filename),name)
+
+def _tryload(filename):
+    try:
+        return filename, loadlinkage2(filename), None
+    except (ValueError,ElementTree.ParseError) as error:
+        return filename, None, str(error)
+
+# Load every file matching pattern in directory, over a pool of
+# processes if processes > 1. Returns mechanisms, a dict
+# filename -> Mechanism, and errors, a dict filename -> message for
+# the files that could not be read or turned into a Mechanism.
+def loaddirectory(directory,pattern='*.linkage2',processes=1):
+    filenames = sorted(glob.glob(os.path.join(directory,pattern)))
+    if processes is None or processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_tryload,filenames,chunksize=16)
+        finally:
+            pool.terminate()
+    else:
+        results = [_tryload(filename) for filename in filenames]
+    mechanisms = {}
+    errors = {}
+    for filename, mech, error in results:
+        if mech is None:
+            errors[filename] = error
+        else:
+            mechanisms[filename] = mech
+    return mechanisms, errors
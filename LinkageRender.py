@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Batched, headless drawing of solved linkages.
+Calling plot() for every link at every step (as HalfAngleMethod.py
+and PinSlider.py did) makes one Line2D per call, so drawing cost
+grows with the number of steps. Here each kind of thing is one
+artist: all link snapshots are one LineCollection, all joint paths
+another, and marked points one scatter.
+Figures are made with the Agg canvas directly (no pyplot, no
+window), so many designs can be written to PDF/PNG in one process,
+reusing one figure.
+Contents:
+* planlinks(): The (joint, joint) pairs to draw for a compiled plan
+  (from Mechanism.py).
+* linksegments(): Kx2x2 array of link segments at the chosen steps.
+* drawlinks(): Link snapshots as one LineCollection.
+* drawpaths(): Joint paths as one LineCollection.
+* drawpoints(): Points as one scatter.
+* newfigure(): A Figure on the Agg canvas, with equal-aspect axes.
+* renderlinkage(): Draw a solved linkage and save it to a file.
+* renderdesigns(): renderlinkage() for many designs, one figure.
+* PathPlotter: Consumer for solve_chunks() drawing decimated paths.
+
+Example:
+    mech, thetas, joints, valid = solveexample('klann')
+    renderlinkage('KlannPlot.png',joints,planlinks(compile_mechanism(mech)),
+                  paths=['joint36','joint56','foot'])
+"""
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+
+from Mechanism import planlinks
+from Profiling import stage as profilestage
+
+#########################
+# Segments of all links at the given steps (default every step),
+# as a Kx2x2 array ready for a LineCollection, ordered step by step.
+def linksegments(joints,links,steps=None):
+    first = np.asarray(joints[links[0][0]])
+    if steps is None:
+        steps = np.arange(first.shape[0])
+    ends1 = np.stack([np.asarray(joints[a])[steps] for a,b in links],axis=1)
+    ends2 = np.stack([np.asarray(joints[b])[steps] for a,b in links],axis=1)
+    return np.stack((ends1,ends2),axis=2).reshape((-1,2,2))
+
+#########################
+# Add the links at every 'every'th step as one LineCollection.
+# colors is one color for all links, or one per link.
+def drawlinks(ax,joints,links,every=2,colors='b',linewidth=1.0,steps=None):
+    if steps is None:
+        numsteps = np.asarray(joints[links[0][0]]).shape[0]
+        steps = np.arange(0,numsteps,every)
+    segments = linksegments(joints,links,steps)
+    if not isinstance(colors,str) and len(colors) == len(links):
+        colors = list(colors)*len(steps)
+    collection = LineCollection(segments,colors=colors,linewidths=linewidth)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+# Add the paths of the named joints as one LineCollection
+def drawpaths(ax,joints,names,colors='g',linewidth=0.5):
+    collection = LineCollection([np.asarray(joints[name]) for name in names],
+                                colors=colors,linewidths=linewidth)
+    ax.add_collection(collection)
+    ax.autoscale_view()
+    return collection
+
+# Add Nx2 points as one scatter
+def drawpoints(ax,points,marker='.',color='k',size=12):
+    points = np.asarray(points).reshape((-1,2))
+    return ax.scatter(points[:,0],points[:,1],s=size,marker=marker,c=color)
+
+#########################
+# Figure with an Agg canvas (no GUI), and equal-aspect, gridded axes
+# like the scripts use.
+def newfigure(figsize=(6.,6.)):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    _setupaxes(fig)
+    return fig
+
+def _setupaxes(fig):
+    ax = fig.add_subplot(1,1,1)
+    ax.grid(True)
+    ax.set_aspect('equal','datalim')
+    return ax
+
+# Draw a solved linkage: link snapshots every 'every' steps, the
+# paths of the joints in paths (default: every moving joint) and
+# dots on the points of the last path. Saves to filename (format
+# from its extension). Pass fig to reuse a figure; it is cleared.
+def renderlinkage(filename,joints,links,paths=None,every=2,fig=None,
+                  title=None,dpi=100):
+    if fig is None:
+        fig = newfigure()
+    else:
+        fig.clf()
+        _setupaxes(fig)
+    ax = fig.axes[0]
+    if paths is None:
+        paths = [name for name in joints
+                 if np.any(np.asarray(joints[name]) != joints[name][0])]
+    with profilestage('plot'):
+        drawlinks(ax,joints,links,every=every,colors='b',linewidth=0.8)
+        if paths:
+            drawpaths(ax,joints,paths)
+            drawpoints(ax,joints[paths[-1]])
+        if title:
+            ax.set_title(title)
+    with profilestage('savefig'):
+        fig.savefig(filename,dpi=dpi)
+    return fig
+
+# renderlinkage() for a sequence of designs, each given as
+# (filename, joints, links), drawing them all with one figure.
+def renderdesigns(designs,paths=None,every=2,dpi=100):
+    fig = newfigure()
+    for filename, joints, links in designs:
+        renderlinkage(filename,joints,links,paths,every,fig,dpi=dpi)
+    return fig
+
+#########################
+# Consumer for solve_chunks()/consume() that keeps every 'every'th
+# point of the named joints, and on close() draws them as paths on
+# ax with one LineCollection.
+class PathPlotter(object):
+
+    def __init__(self,ax,names,every=1,colors='g',linewidth=0.5):
+        self.ax = ax
+        self.names = names
+        self.every = every
+        self.colors = colors
+        self.linewidth = linewidth
+        self.points = dict((name,[]) for name in names)
+
+    def __call__(self,start,thetas,joints,valid):
+        #keep steps whose index in the whole run is a multiple of every
+        first = (-start) % self.every
+        for name in self.names:
+            self.points[name].append(np.array(joints[name][first::self.every]))
+
+    def close(self):
+        paths = dict((name,np.concatenate(self.points[name]))
+                     for name in self.names if self.points[name])
+        if paths:
+            drawpaths(self.ax,paths,list(paths),self.colors,self.linewidth)
@@ -7,12 +7,28 @@ Utility functions useful for solving linkages. Used in examples:
 Contents:
 * arcpoints(): Compute points in an arc.
 * coupler(): Given 2 points and an angle and distance, compute the third point.
+* polar(): Angle and distance from one point to another.
 * circcirc(): Compute intersection of two circles.
+* circcirc_batch(): circcirc() for N pairs of circles at once, with
+  a mask of which pairs intersect.
+* trackbranch(): Follow the continuous branch of circcirc_batch()
+  solutions along a trajectory instead of a fixed assembly, also
+  through change points where the two solutions meet.
+* dyadrates(): First and second derivatives of a circcirc() joint
+  from those of its two neighbours.
+* couplerrates(): First and second derivatives of a coupler() point.
 * grashof(): Check if 4-bar linkage satisfies Grashof criterion (continuous rotation)
+* grashof_batch(): Grashof class and crank assemblability of N
+  four-bars at once, to prune candidates before solving them.
+* halfangle(): Closed-form 4-bar solution (tangent half-angle method)
+  for arrays of crank angles and link lengths, both inversions at once.
 
 Functions all use Numpy and Matplotlib for Matlab-like syntax so
 they are easy to translate to Matlab. Points are 2 element arrays (x,y).
 Trajectories are Nx2 arrays with points in each row.
+
+Usage:
+  python LinkageUtilities.py     (checks trackbranch() at a change point)
 """
 
 import numpy as np
@@ -26,9 +42,9 @@ def arcpoints(cpoint,radius,thetastart,thetaend,numsteps):
     thetas = np.linspace(thetastart,thetaend,numsteps)
     plotpts = np.zeros((numsteps,2),float)          #array for the output
     
-    for i in range(0,numsteps):
-        plotpts[i,0] = cpoint[0] + radius*np.cos(thetas[i])
-        plotpts[i,1] = cpoint[1] + radius*np.sin(thetas[i])
+    #Fill whole columns at once rather than looping over thetas
+    plotpts[:,0] = cpoint[0] + radius*np.cos(thetas)
+    plotpts[:,1] = cpoint[1] + radius*np.sin(thetas)
 
     return plotpts
 
@@ -39,16 +55,26 @@ def arcpoints(cpoint,radius,thetastart,thetaend,numsteps):
 
 #Useful for plotting coupler points or end
 #points of bent links. 
-#point1, point2 and cpoint are 2-element arrays
+#point1, point2 and cpoint are 2-element arrays, or Nx2
+#trajectories to get a whole Nx2 trajectory of cpoints at once
+#(r and theta may then be scalars or N-element arrays).
 def coupler(point1,point2,r,theta):
+      point1 = np.asarray(point1,float)
+      point2 = np.asarray(point2,float)
       delta = point2-point1
-      phi = np.arctan2(delta[1],delta[0])
+      phi = np.arctan2(delta[...,1],delta[...,0])
       psi = phi+theta
       rx = r*np.cos(psi)
       ry = r*np.sin(psi)
-      cpoint = point2+np.array([rx,ry])
+      cpoint = point2+np.stack((rx,ry),axis=-1)
       return cpoint
 
+# Angle of the vector from point1 to point2, and the distance
+# between them: the link angle and length of a drawn linkage.
+def polar(point1,point2):
+    d = np.asarray(point2,float)-np.asarray(point1,float)
+    return np.arctan2(d[1],d[0]), np.linalg.norm(d)
+
 #########################
 
 # Adapted from circirc.m in the Matlab Mapping Toolbox
@@ -94,6 +120,172 @@ def circcirc(point1,r1,point2,r2):
     
     return circpoints
 
+#########################
+# Batched version of circcirc() for N pairs of circles at once,
+# e.g. one pair per crank angle. Avoids a Python loop per step.
+
+# points1, points2 are Nx2 arrays (or 2-element arrays, which are
+# broadcast against the other argument). r1, r2 are scalars or
+# N-element arrays. circpoints is an Nx2x2 array:
+#   first solutions:   circpoints[:,0,:]
+#   second solutions:  circpoints[:,1,:]
+# with the same left/right convention as circcirc().
+# assemblable is an N-element boolean array, False where the
+# circles do not intersect (or a radius is negative). Those rows
+# of circpoints are NaN. Tangent circles (within tol) count as
+# assemblable and both solutions are the single touching point.
+
+def circcirc_batch(points1,r1,points2,r2,tol=1e-12):
+    points1 = np.asarray(points1,float)
+    points2 = np.asarray(points2,float)
+    r1 = np.asarray(r1,float)
+    r2 = np.asarray(r2,float)
+
+    delta = points2 - points1
+    delta = delta.reshape((-1,2))
+    r12sq = delta[:,0]*delta[:,0] + delta[:,1]*delta[:,1]
+    r12 = np.sqrt(r12sq)
+
+    #cosine of angle between line of centres and radius r1
+    with np.errstate(divide='ignore',invalid='ignore'):
+        cosalpha = (r12sq + r1*r1 - r2*r2)/(2*r1*r12)
+    assemblable = (r1 >= 0) & (r2 >= 0) & (np.abs(cosalpha) <= 1+tol)
+    #Clip the nearly tangent cases so they give the touching point
+    alpha1 = np.arccos(np.clip(cosalpha,-1.0,1.0))
+    alpha1 = np.where(assemblable,alpha1,np.nan)
+
+    phi = np.arctan2(delta[:,1],delta[:,0])
+    thetas = np.stack((phi+alpha1,phi-alpha1),axis=-1)   #Nx2
+
+    rr = np.reshape(r1,(-1,1))
+    circpoints = np.empty(thetas.shape+(2,),float)
+    circpoints[...,0] = np.reshape(points1,(-1,1,2))[...,0] + rr*np.cos(thetas)
+    circpoints[...,1] = np.reshape(points1,(-1,1,2))[...,1] + rr*np.sin(thetas)
+
+    return circpoints, assemblable
+
+#########################
+# Picking the same solution (assembly) of circcirc_batch() at every
+# step jumps to the other branch wherever the two solutions swap
+# sides. Keeping the joint on whichever solution is nearest its last
+# position isn't enough either: where the two solutions meet (a
+# change point, e.g. a parallelogram four-bar folding flat) each
+# label stays nearest to itself on both sides of it. Instead,
+# predict the joint by extrapolating linearly from its last two
+# positions and take the solution nearest the prediction, so it
+# carries on through the meeting point in the direction it was
+# moving.
+
+# circpoints is the Nx2x2 output of circcirc_batch() for N
+# consecutive steps (or ...xNx2x2 for several trajectories at once),
+# assembly the solution to start on. Returns
+#   points   - Nx2 array of the tracked joint positions
+#   branch   - N array of which solution (0 or 1) was used
+#   switched - N booleans, True where the branch changed
+# Steps that can't be assembled (NaN) are skipped over. The
+# prediction goes by thetas, the input angle (or any parameter the
+# joint moves smoothly with) at each step, N or ...xN, default the
+# step numbers 0..N-1, so steps need not be evenly spaced but must
+# be fine enough for the joint to move nearly in a straight line
+# over two of them. To continue tracking from an earlier stretch of
+# the trajectory, give previous, its last (up to) two tracked
+# positions (Kx2, or ...xKx2, oldest first), previousthetas, their
+# input angles (default the step numbers -K..-1), and assembly, the
+# branch used at the last of them.
+def trackbranch(circpoints,assembly=0,previous=None,thetas=None,
+                previousthetas=None):
+    circpoints = np.asarray(circpoints,float)
+    lead, numsteps = circpoints.shape[:-3], circpoints.shape[-3]
+    ok = np.isfinite(circpoints[...,0,:]).all(axis=-1)
+    if thetas is None:
+        thetas = np.arange(numsteps)
+    thetas = np.broadcast_to(np.asarray(thetas,float),lead+(numsteps,))
+
+    #last two tracked positions (oldest first) and their angles, NaN if none
+    known = np.full(lead+(2,2),np.nan)
+    angles = np.full(lead+(2,),np.nan)
+    if previous is not None:
+        previous = np.asarray(previous,float)[...,-2:,:]
+        count = previous.shape[-2]
+        if previousthetas is None:
+            previousthetas = np.arange(-count,0)
+        known[...,2-count:,:] = previous
+        angles[...,2-count:] = np.asarray(previousthetas,float)[...,-count:]
+    label = np.array(np.broadcast_to(assembly,lead),int)
+    branch = np.empty(lead+(numsteps,),int)
+    switched = np.zeros(lead+(numsteps,),bool)
+    for k in range(numsteps):
+        c = circpoints[...,k,:,:]
+        with np.errstate(invalid='ignore',divide='ignore'):
+            slope = (thetas[...,k]-angles[...,1])/(angles[...,1]-angles[...,0])
+            predicted = known[...,1,:] + slope[...,None]*(known[...,1,:]-known[...,0,:])
+        predicted = np.where(np.isfinite(predicted),predicted,known[...,1,:])
+        nearest = (np.sum((c[...,1,:]-predicted)**2,axis=-1)
+                   < np.sum((c[...,0,:]-predicted)**2,axis=-1)).astype(int)
+        tracked = ok[...,k] & ~np.isnan(angles[...,1])
+        switched[...,k] = tracked & (nearest != label)
+        label = np.where(tracked,nearest,label)
+        branch[...,k] = label
+        point = np.take_along_axis(c,label[...,None,None],axis=-2)[...,0,:]
+        known = np.where(ok[...,k,None,None],
+                         np.stack((known[...,1,:],point),axis=-2),known)
+        angles = np.where(ok[...,k,None],
+                          np.stack((angles[...,1],thetas[...,k]),axis=-1),angles)
+    points = np.take_along_axis(circpoints,branch[...,None,None],axis=-2)[...,0,:]
+    return points, branch, switched
+
+#########################
+# Kinematic coefficients: derivatives of joint positions with respect
+# to the input crank angle (multiply by the crank speed, and its
+# square, for velocities and accelerations at constant speed).
+# All arguments are Nx2 arrays (or 2-element arrays, broadcast),
+# given as position, first and second derivative of each joint.
+
+# point is a circcirc() solution at distance r1 from point1 and r2
+# from point2. Differentiating |point-point1|**2 = r1**2 (and the
+# same for point2) gives a 2x2 linear system for its derivatives:
+#   (point-point1).dpoint = (point-point1).dpoint1
+#   (point-point1).ddpoint = (point-point1).ddpoint1 - |dpoint-dpoint1|**2
+# solved here by Cramer's rule. At a toggle position (the three
+# joints in line) the system is singular and the results are inf.
+def dyadrates(point,point1,dpoint1,ddpoint1,point2,dpoint2,ddpoint2):
+    a = np.asarray(point,float) - point1
+    b = np.asarray(point,float) - point2
+    det = a[...,0]*b[...,1] - a[...,1]*b[...,0]
+
+    def solve2(rhsa,rhsb):
+        with np.errstate(divide='ignore',invalid='ignore'):
+            return np.stack(((rhsa*b[...,1] - a[...,1]*rhsb)/det,
+                             (a[...,0]*rhsb - rhsa*b[...,0])/det),axis=-1)
+    dpoint = solve2(np.sum(a*dpoint1,axis=-1),np.sum(b*dpoint2,axis=-1))
+    ddpoint = solve2(np.sum(a*ddpoint1,axis=-1)
+                     - np.sum((dpoint-dpoint1)**2,axis=-1),
+                     np.sum(b*ddpoint2,axis=-1)
+                     - np.sum((dpoint-dpoint2)**2,axis=-1))
+    return dpoint, ddpoint
+
+# Derivatives of cpoint = coupler(point1,point2,r,theta). The link
+# direction psi = arctan2(d) + theta, d = point2-point1, turns at
+#   dpsi = (d x dd)/|d|**2
+# and cpoint = point2 + r*(cos(psi),sin(psi)).
+def couplerrates(point1,dpoint1,ddpoint1,point2,dpoint2,ddpoint2,r,theta):
+    d = np.asarray(point2,float) - point1
+    dd = np.asarray(dpoint2,float) - dpoint1
+    ddd = np.asarray(ddpoint2,float) - ddpoint1
+    length2 = np.sum(d**2,axis=-1)
+    cross1 = d[...,0]*dd[...,1] - d[...,1]*dd[...,0]
+    cross2 = d[...,0]*ddd[...,1] - d[...,1]*ddd[...,0]
+    dpsi = cross1/length2
+    ddpsi = cross2/length2 - 2*cross1*np.sum(d*dd,axis=-1)/length2**2
+    psi = np.arctan2(d[...,1],d[...,0]) + theta
+    radial = np.stack((np.cos(psi),np.sin(psi)),axis=-1)
+    normal = np.stack((-np.sin(psi),np.cos(psi)),axis=-1)
+    r = np.asarray(r,float)[...,None]
+    dcpoint = dpoint2 + r*dpsi[...,None]*normal
+    ddcpoint = (ddpoint2 + r*ddpsi[...,None]*normal
+                - r*(dpsi**2)[...,None]*radial)
+    return dcpoint, ddcpoint
+
 #########################
 
 def grashof(link1,link2,link3,link4):
@@ -104,3 +296,132 @@ def grashof(link1,link2,link3,link4):
         isgrashof = False
 
     return isgrashof
+
+#########################
+# Names of the four-bar classes returned by grashof_batch()
+FOURBARKINDS = ('crank-rocker',     #Grashof, input link shortest
+                'rocker-crank',     #Grashof, output link shortest
+                'double-crank',     #Grashof, ground link shortest
+                'rocker-rocker',    #Grashof, coupler shortest
+                'triple-rocker',    #non-Grashof: no link turns fully
+                'change-point')     #shortest+longest == sum of other two
+
+# Classify many four-bars at once. links is an Nx4 array of link
+# lengths in the order of grashof() and halfangle(): ground (link1),
+# input crank (link2), coupler (link3), output (link4).
+# Returns a dict of N-element arrays:
+#   'grashof'     - shortest+longest <= sum of the other two
+#   'kind'        - index into FOURBARKINDS
+#   'assemblable' - can be assembled at some input angle
+#   'inputturns'  - can be assembled at every input angle, i.e. the
+#                   input works as a crank through a full turn: the
+#                   diagonal from the crank pin to the output pivot,
+#                   between |link1-link2| and link1+link2, always fits
+#                   between |link3-link4| and link3+link4
+# Lengths that aren't all positive give False and 'triple-rocker'.
+# tol is relative to the longest link, for the equalities.
+def grashof_batch(links,tol=1e-12):
+    links = np.asarray(links,float).reshape((-1,4))
+    l1, l2, l3, l4 = links[:,0], links[:,1], links[:,2], links[:,3]
+    ordered = np.sort(links,axis=1)
+    eps = tol*ordered[:,3]
+    positive = ordered[:,0] > 0
+
+    excess = ordered[:,0] + ordered[:,3] - ordered[:,1] - ordered[:,2]
+    changepoint = positive & (np.abs(excess) <= eps)
+    isgrashof = positive & (excess <= eps)
+
+    shortest = np.argmin(links,axis=1)
+    kind = np.choose(shortest,(2,0,3,1))
+    kind = np.where(isgrashof,kind,4)
+    kind = np.where(changepoint,5,kind)
+
+    lo = np.maximum(np.abs(l1-l2),np.abs(l3-l4))
+    hi = np.minimum(l1+l2,l3+l4)
+    assemblable = positive & (lo <= hi+eps)
+    inputturns = (positive & (l1+l2 <= l3+l4+eps)
+                  & (np.abs(l1-l2) >= np.abs(l3-l4)-eps))
+    return {'grashof':isgrashof,'kind':kind,'assemblable':assemblable,
+            'inputturns':inputturns}
+
+#########################
+# Closed-form 4-bar solution by the tangent half-angle method of
+# M. Stanisic, as in HalfAngleMethod.py, for whole arrays at once.
+# Vector loop is R2 + R3 = R1 + R4, with R1 horizontal from joint1 at
+# (0,0) to joint4 at (R1,0). All angles anticlockwise from horizontal.
+# theta2s are input crank angles. R1-R4 (and the coupler point R5,
+# gammac: distance from joint2 and angle from link3) may be scalars
+# or arrays that broadcast against theta2s, e.g. Mx1 link lengths
+# with N crank angles give MxN results.
+# Returns a dict; the first axis of each entry is the inversion
+# (0: the '+' root, 1: the inverted '-' root):
+#   'theta3', 'theta4' - 2x... link angles
+#   'joint2'           - ...x2 crank pin (same for both inversions)
+#   'joint3'           - 2x...x2 joint between links 3 and 4
+#   'coupler'          - 2x...x2 coupler points
+#   'valid'            - ... booleans, False where the linkage can't
+#                        be assembled (A**2 + B**2 - C**2 < 0); those
+#                        entries are NaN.
+def halfangle(theta2s,R1,R2,R3,R4,R5=0.0,gammac=0.0):
+    cosq2 = np.cos(theta2s)
+    sinq2 = np.sin(theta2s)
+
+    # Define some substitutions (9.29-9.31)
+    A = 2*R4*(R1 - R2*cosq2)
+    B = -2*R2*R4*sinq2
+    C = R3**2 - R2**2 - R4**2 - R1**2 + 2*R2*R1*cosq2
+
+    #Roots of the half angle equation (9.35), both inversions
+    disc = A**2 + B**2 - C**2
+    valid = disc >= 0
+    root = np.sqrt(np.where(valid,disc,np.nan))
+    with np.errstate(divide='ignore',invalid='ignore'):
+        u4 = np.stack(((B + root)/(A+C),(B - root)/(A+C)))
+    q4 = 2*np.arctan(u4)
+
+    #Solve for theta3 (9.37-9.39), range = -PI to +PI
+    cosq3 = (-R2*cosq2 + R4*np.cos(q4) + R1)/R3
+    sinq3 = (-R2*sinq2 + R4*np.sin(q4))/R3
+    q3 = np.arctan2(sinq3,cosq3)
+
+    X2 = R2*cosq2
+    Y2 = R2*sinq2
+    joint2 = np.stack(np.broadcast_arrays(X2,Y2),axis=-1)
+    joint3 = np.stack((X2+R3*cosq3,Y2+R3*sinq3),axis=-1)
+    couplerpts = np.stack((X2+R5*np.cos(q3+gammac),
+                           Y2+R5*np.sin(q3+gammac)),axis=-1)
+    return {'theta3':q3,'theta4':q4,'joint2':joint2,'joint3':joint3,
+            'coupler':couplerpts,'valid':np.broadcast_to(valid,q3.shape[1:])}
+
+#########################
+if __name__ == '__main__':
+    #A parallelogram four-bar (ground 4, crank and rocker 1, coupler 4)
+    #folds flat at crank angle pi, where the two dyad solutions meet.
+    #Staying a parallelogram, joint34 = joint23 + (4,0), means taking
+    #the other label from there on: one switch, in whole or in pieces.
+    #Also on uneven steps, where the prediction must go by angle.
+    rng = np.random.default_rng(0)
+    uneven = np.sort(rng.uniform(0.,2*np.pi,200))
+    for thetas in [2*np.pi*np.arange(n)/float(n) for n in (72,73,100,360)] + [uneven]:
+        numsteps = thetas.shape[0]
+        joints23 = np.column_stack((np.cos(thetas),np.sin(thetas)))
+        circpoints, valid = circcirc_batch(joints23,4.,np.array([4.,0.]),1.)
+        expected = joints23 + [4.,0.]
+        assembly = int(np.argmin(np.sum((circpoints[0]-expected[0])**2,axis=-1)))
+        points, branch, switched = trackbranch(circpoints,assembly,thetas=thetas)
+        error = np.max(np.hypot(*(points-expected).T))
+        assert error < 1e-9 and np.sum(switched) == 1, (numsteps,error)
+        switch = thetas[np.flatnonzero(switched)[0]]
+        assert thetas[np.flatnonzero(switched)[0]-1] <= np.pi <= switch, numsteps
+        pieces = []
+        previous, label = None, assembly
+        for start in range(0,numsteps,17):
+            piece, labels, _ = trackbranch(circpoints[start:start+17],label,previous,
+                                           thetas[start:start+17],thetas[:start][-2:])
+            pieces.append(piece)
+            previous = np.concatenate(pieces)[-2:]
+            label = labels[-1]
+        error = max(error,np.max(np.hypot(*(np.concatenate(pieces)-expected).T)))
+        assert error < 1e-9, (numsteps,error)
+        print('%3d steps: switch at %.4g deg, error %.3g'
+              % (numsteps,np.degrees(switch),error))
@@ -0,0 +1,421 @@
+# -*- coding: utf-8 -*-
+"""
+Declarative description of a planar linkage, compiled into an
+ordered plan of whole-array solve stages.
+Instead of writing the "circcirc -> pick assembly -> coupler" loop
+by hand for every mechanism (as in CircCirc4Bar.py, Klann-ish.py,
+Jansen-lite.py), describe the joints by name and let solve() run
+each stage over all crank angles at once.
+Contents:
+* Mechanism: collects the elements of a linkage:
+    ground()  - fixed pivot
+    crank()   - joint on a link rotating about a pivot, driven by the input
+    gear()    - crank geared to another crank (as in Geared5Bar.py)
+    dyad()    - RRR dyad: joint at the intersection of two circles
+    coupler() - point on a rigid "bent link", see coupler()
+* compile_mechanism(): Check the elements and sort them into a plan.
+* solve_plan(): Evaluate a plan for an array of input angles.
+* solve(): compile_mechanism() and solve_plan() in one step.
+* solve_kinematics(): solve_plan() plus the first and second
+  derivatives of every joint with respect to the input angle.
+* planlinks(): The (joint, joint) pairs joined by links in a plan.
+* inputperiod(): Input rotation after which every crank is back
+  where it started (e.g. 4*pi for a -2 gear ratio).
+* cyclethetas(): Input angles sampling one such period.
+* solve_periodic(): Solve only the distinct positions within one
+  period and map the requested angles onto them.
+* unfold(): Expand a periodic solution back to every requested angle.
+* solve_chunks(): Generate the solution of a long, evenly stepped
+  run in fixed-size chunks, carrying the branches across chunks.
+* consume(): Feed such chunks to writers, metrics or plotters.
+
+Example, the four-bar of CircCirc4Bar.py:
+    mech = Mechanism('fourbar')
+    mech.ground('joint12',initjoints[0,:])
+    mech.ground('joint14',initjoints[3,:])
+    mech.crank('joint23','joint12',l2)
+    mech.dyad('joint34','joint23',l3,'joint14',l4,assembly)
+    mech.coupler('coupler','joint34','joint23',lc,np.pi+gammac)
+    joints, valid = solve(mech,np.linspace(0.,1.95*np.pi,20))
+joints['coupler'] is then the Nx2 coupler trajectory.
+See MechanismExamples.py for the other example linkages.
+"""
+
+import numpy as np
+from fractions import Fraction
+
+from LinkageUtilities import trackbranch, dyadrates, couplerrates
+from KinematicKernels import circcirc_batch, coupler
+from Profiling import stage as profilestage
+
+#########################
+# A mechanism is just a named list of elements. Each element is
+# a tuple (kind, name, parameters...) of plain numbers and names,
+# so it is easy to print, compare or hash.
+# Input angle theta drives every crank: a crank's angle is
+#   phase + ratio*theta
+# theta0 is the input angle of the initial (as-drawn) configuration.
+class Mechanism(object):
+
+    def __init__(self,name='',theta0=0.0):
+        self.name = name
+        self.theta0 = float(theta0)
+        self.elements = []
+
+    def ground(self,name,point):
+        point = np.asarray(point,float)
+        self.elements.append(('ground',name,
+                              (float(point[0]),float(point[1]))))
+
+    # Input crank (ratio=1), or any link turning at a fixed ratio
+    # of the input angle.
+    def crank(self,name,center,radius,phase=0.0,ratio=1.0):
+        self.elements.append(('crank',name,center,float(radius),
+                              float(phase),float(ratio)))
+
+    # Crank geared to the crank 'driver'. gearratio is driver gear
+    # rotations per rotation of this one: negative if the gears mesh
+    # directly, positive with a belt or idler (as in Geared5Bar.py).
+    # start is the angle of this crank when driver is at driverstart.
+    def gear(self,name,center,radius,driver,gearratio,start,driverstart=0.0):
+        self.elements.append(('gear',name,center,float(radius),driver,
+                              float(gearratio),float(start),float(driverstart)))
+
+    # Joint at distance r1 from joint1 and r2 from joint2.
+    # assembly picks the solution of circcirc(): 0 is on the left
+    # going from joint1 to joint2, 1 is on the right.
+    def dyad(self,name,joint1,r1,joint2,r2,assembly=0):
+        self.elements.append(('dyad',name,joint1,float(r1),joint2,
+                              float(r2),int(assembly)))
+
+    # Point at distance r from joint2, at angle theta (anticlockwise)
+    # from the direction joint1 -> joint2. Same as coupler().
+    def coupler(self,name,joint1,joint2,r,theta):
+        self.elements.append(('coupler',name,joint1,joint2,float(r),
+                              float(theta)))
+
+    # Names of all joints, in the order they were added
+    def jointnames(self):
+        return [element[1] for element in self.elements]
+
+#########################
+# Names of the joints an element needs before it can be solved
+def _dependencies(element):
+    kind = element[0]
+    if kind == 'ground':
+        return ()
+    if kind == 'crank':
+        return (element[2],)
+    if kind == 'gear':
+        return (element[2],element[4])
+    if kind == 'dyad':
+        return (element[2],element[4])
+    if kind == 'coupler':
+        return (element[2],element[3])
+    raise ValueError('unknown element kind: %r' % (kind,))
+
+#########################
+# Turn a Mechanism into an ordered plan: a list of stages where
+# every stage only uses joints solved by earlier stages.
+# Gears are resolved into cranks with their own phase and ratio,
+# so a plan only has 'ground', 'crank', 'dyad' and 'coupler' stages:
+#   ('ground',name,(x,y))
+#   ('crank',name,center,radius,phase,ratio)
+#   ('dyad',name,joint1,r1,joint2,r2,assembly)
+#   ('coupler',name,joint1,joint2,r,theta)
+# Raises ValueError for duplicate or missing joints, and for
+# elements that depend on each other in a loop.
+def compile_mechanism(mech):
+    elements = {}
+    for element in mech.elements:
+        if element[1] in elements:
+            raise ValueError('joint %r is defined twice' % (element[1],))
+        elements[element[1]] = element
+    for element in mech.elements:
+        for dep in _dependencies(element):
+            if dep not in elements:
+                raise ValueError('joint %r needs undefined joint %r'
+                                 % (element[1],dep))
+
+    plan = []
+    cranks = {}            #name -> (phase, ratio) of solved cranks
+    solved = set()
+    pending = list(mech.elements)
+    while pending:
+        remaining = []
+        for element in pending:
+            if not all(dep in solved for dep in _dependencies(element)):
+                remaining.append(element)
+                continue
+            kind, name = element[0], element[1]
+            if kind == 'crank':
+                cranks[name] = (element[4],element[5])
+            elif kind == 'gear':
+                center, radius, driver = element[2], element[3], element[4]
+                gearratio, start, driverstart = element[5:8]
+                if driver not in cranks:
+                    raise ValueError('gear %r must be driven by a crank, not %r'
+                                     % (name,driver))
+                dphase, dratio = cranks[driver]
+                # angle = start + (driverangle - driverstart)/gearratio
+                phase = start + (dphase - driverstart)/gearratio
+                ratio = dratio/gearratio
+                cranks[name] = (phase,ratio)
+                element = ('crank',name,center,radius,phase,ratio)
+            plan.append(element)
+            solved.add(name)
+        if len(remaining) == len(pending):
+            raise ValueError('cannot order joints %s; they depend on each other'
+                             % ', '.join(repr(e[1]) for e in remaining))
+        pending = remaining
+    return plan
+
+#########################
+# Evaluate a plan for an array of N input angles thetas.
+# Each stage is solved for all N angles with one whole-array call.
+# Returns joints, a dict of name -> Nx2 array (ground pivots are
+# read-only broadcast views), and valid, an N-element boolean array
+# that is False wherever some dyad cannot be assembled.
+# branch='fixed' uses each dyad's assembly at every step, as the
+# scripts do. branch='track' starts each dyad on its assembly and
+# then follows the continuous solution (see trackbranch()), also
+# through change points, so thetas should be in order of motion.
+# If events is a dict, it is filled in with, for each dyad name,
+#   events['switches'][name] - steps where the tracked branch changed
+#   events['lost'][name]     - steps where the dyad can't be assembled
+# When solving a long run in pieces, pass the same state dict to
+# each call: branch tracking then continues from the previous piece.
+# If derivatives is a dict, it is filled in with the kinematic
+# coefficients of every joint, computed analytically stage by stage:
+#   derivatives['velocity'][name]     - Nx2 d(position)/d(theta)
+#   derivatives['acceleration'][name] - Nx2 d2(position)/d(theta)2
+# (see dyadrates(), couplerrates(); also solve_kinematics()).
+# circcirc_batch() and coupler() run on the backend selected in
+# KinematicKernels.py.
+# With profiling on (see Profiling.py) each stage is timed as
+# '<kind> <joint>', e.g. 'dyad joint34'.
+def solve_plan(plan,thetas,branch='fixed',events=None,state=None,
+               derivatives=None):
+    if branch not in ('fixed','track'):
+        raise ValueError("branch must be 'fixed' or 'track', not %r" % (branch,))
+    thetas = np.atleast_1d(np.asarray(thetas,float))
+    numsteps = thetas.shape[0]
+    joints = {}
+    valid = np.ones(numsteps,bool)
+    if events is not None:
+        events['switches'] = {}
+        events['lost'] = {}
+    rates = {}             #name -> (first, second derivative)
+    for stage in plan:
+        kind, name = stage[0], stage[1]
+        with profilestage(kind+' '+name,numsteps):
+            if kind == 'ground':
+                joints[name] = np.asarray(stage[2],float)
+                if derivatives is not None:
+                    rates[name] = (np.zeros(2),np.zeros(2))
+            elif kind == 'crank':
+                center, radius, phase, ratio = stage[2:6]
+                angles = phase + ratio*thetas
+                points = np.empty((numsteps,2),float)
+                points[:,0] = joints[center][...,0] + radius*np.cos(angles)
+                points[:,1] = joints[center][...,1] + radius*np.sin(angles)
+                joints[name] = points
+                if derivatives is not None:
+                    dcenter, ddcenter = rates[center]
+                    radial = points - joints[center]
+                    normal = np.stack((-radial[:,1],radial[:,0]),axis=-1)
+                    rates[name] = (dcenter + ratio*normal,
+                                   ddcenter - ratio**2*radial)
+            elif kind == 'dyad':
+                joint1, r1, joint2, r2, assembly = stage[2:7]
+                circpoints, assemblable = circcirc_batch(joints[joint1],r1,
+                                                         joints[joint2],r2)
+                circpoints = np.broadcast_to(circpoints,(numsteps,2,2))
+                assemblable = np.broadcast_to(assemblable,(numsteps,))
+                if branch == 'track':
+                    previous = previousthetas = None
+                    if state is not None and name in state:
+                        previous, previousthetas, assembly = state[name]
+                    points, labels, switched = trackbranch(circpoints,assembly,
+                                                           previous,thetas,
+                                                           previousthetas)
+                    ok = np.flatnonzero(assemblable)[-2:]
+                    if state is not None and ok.size:
+                        #last two tracked positions, for the next piece
+                        known, angles = points[ok], thetas[ok]
+                        if ok.size < 2 and previous is not None:
+                            known = np.concatenate((previous[-1:],known))
+                            angles = np.concatenate((previousthetas[-1:],angles))
+                        state[name] = (known.copy(),angles,int(labels[ok[-1]]))
+                else:
+                    points = circpoints[:,assembly,:]
+                    switched = np.zeros(numsteps,bool)
+                joints[name] = _steps(points,numsteps)
+                valid &= assemblable
+                if derivatives is not None:
+                    (d1, dd1), (d2, dd2) = rates[joint1], rates[joint2]
+                    rates[name] = dyadrates(joints[name],joints[joint1],d1,dd1,
+                                            joints[joint2],d2,dd2)
+                if events is not None:
+                    events['switches'][name] = np.flatnonzero(switched)
+                    events['lost'][name] = np.flatnonzero(~assemblable)
+            elif kind == 'coupler':
+                joint1, joint2, r, theta = stage[2:6]
+                joints[name] = _steps(coupler(joints[joint1],joints[joint2],
+                                              r,theta),numsteps)
+                if derivatives is not None:
+                    (d1, dd1), (d2, dd2) = rates[joint1], rates[joint2]
+                    rates[name] = couplerrates(joints[joint1],d1,dd1,
+                                               joints[joint2],d2,dd2,r,theta)
+            else:
+                raise ValueError('unknown stage kind: %r' % (kind,))
+
+    for name in joints:
+        joints[name] = _steps(joints[name],numsteps)
+    if derivatives is not None:
+        derivatives['velocity'] = dict((name,_steps(rates[name][0],numsteps))
+                                       for name in rates)
+        derivatives['acceleration'] = dict((name,_steps(rates[name][1],numsteps))
+                                           for name in rates)
+    return joints, valid
+
+# Make points an Nx2 array: a contiguous copy of a solved trajectory,
+# or a read-only broadcast view of a point that doesn't move.
+def _steps(points,numsteps):
+    if points.shape == (numsteps,2):
+        return np.ascontiguousarray(points)
+    return np.broadcast_to(points.reshape((-1,2))[0],(numsteps,2))
+
+#########################
+# Compile a Mechanism and solve it for input angles thetas.
+def solve(mech,thetas):
+    return solve_plan(compile_mechanism(mech),thetas)
+
+# Solve a plan along with its kinematic coefficients. Returns
+# joints, velocities, accelerations, valid, where velocities[name]
+# and accelerations[name] are the Nx2 first and second derivatives
+# of joints[name] with respect to the input angle. For an input
+# turning at constant speed omega (rad/s), omega*velocities[name] is
+# the velocity and omega**2*accelerations[name] the acceleration.
+# They are exact at every step however coarse thetas is, but
+# infinite at toggle positions of a dyad.
+def solve_kinematics(plan,thetas,branch='fixed'):
+    derivatives = {}
+    joints, valid = solve_plan(plan,thetas,branch,derivatives=derivatives)
+    return (joints,derivatives['velocity'],derivatives['acceleration'],
+            valid)
+
+# Links of a plan from compile_mechanism(), as (joint, joint) pairs:
+# each crank to its pivot, each dyad joint to its two joints, and
+# each coupler point to the two joints of its bent link.
+def planlinks(plan):
+    links = []
+    for stage in plan:
+        kind, name = stage[0], stage[1]
+        if kind == 'crank':
+            links.append((stage[2],name))
+        elif kind == 'dyad':
+            links.append((stage[2],name))
+            links.append((stage[4],name))
+        elif kind == 'coupler':
+            links.append((stage[3],name))
+            links.append((stage[2],name))
+    return links
+
+#########################
+# Input rotation after which the mechanism repeats itself: the
+# smallest T such that every crank turns a whole number of times,
+# i.e. ratio*T is a multiple of 2*pi for every crank ratio.
+# Ratios (and gear ratios) must be rational; with a crank ratio of
+# p/q in lowest terms the input needs q turns. Returns None if some
+# ratio is not close to a fraction with denominator <= maxden.
+def inputperiod(plan,maxden=1000):
+    turns = 1
+    for stage in plan:
+        if stage[0] != 'crank':
+            continue
+        ratio = stage[5]
+        fraction = Fraction(ratio).limit_denominator(maxden)
+        if abs(float(fraction)-ratio) > 1e-9*max(1.0,abs(ratio)):
+            return None
+        # least common multiple of the denominators
+        q = fraction.denominator
+        a, b = turns, q
+        while b:
+            a, b = b, a % b
+        turns = turns*q//a
+    return 2*np.pi*turns
+
+# numsteps input angles evenly covering one period from thetastart,
+# without repeating the start position at the end.
+def cyclethetas(plan,thetastart,numsteps,direction=1):
+    period = inputperiod(plan)
+    if period is None:
+        raise ValueError('crank ratios are not rational; no period')
+    return thetastart + direction*period*np.arange(numsteps)/float(numsteps)
+
+#########################
+# Like solve_plan(), but each distinct position within one period
+# (see inputperiod()) is solved only once. Input angles that differ
+# by whole periods (within tol of a period) share a solution.
+# Returns joints and valid for the distinct angles only, plus an
+# index array with one entry per angle in thetas, so that
+#   joints[name][index]    is the full Nx2 trajectory
+# or use unfold(). Runs of many periods at the same step (e.g. from
+# cyclethetas() or np.arange()) cost the same as a single period.
+# If there is no period, every angle is solved.
+def solve_periodic(plan,thetas,tol=1e-9):
+    thetas = np.atleast_1d(np.asarray(thetas,float))
+    period = inputperiod(plan)
+    if period is None:
+        joints, valid = solve_plan(plan,thetas)
+        return joints, valid, np.arange(thetas.shape[0])
+    scale = int(round(1.0/tol))
+    phase = np.mod(thetas-thetas[0],period)/period
+    keys = np.mod(np.round(phase*scale).astype(np.int64),scale)
+    _, first, index = np.unique(keys,return_index=True,return_inverse=True)
+    joints, valid = solve_plan(plan,thetas[first])
+    return joints, valid, index.reshape(-1)
+
+# Expand the distinct-angle results of solve_periodic() back to one
+# row per requested angle. Works on the joints dict or one array.
+def unfold(cycle,index):
+    if isinstance(cycle,dict):
+        return dict((name,points[index]) for name,points in cycle.items())
+    return cycle[index]
+
+#########################
+# Solve numsteps input angles evenly spaced from thetastart to
+# thetaend (as np.linspace()) in chunks of at most chunksize steps,
+# so memory stays the same however long the run is. Branch tracking
+# (branch='track') carries on from chunk to chunk.
+# Generates (start, thetas, joints, valid) for each chunk, where start
+# is the index of the chunk's first step in the whole run.
+def solve_chunks(plan,thetastart,thetaend,numsteps,chunksize=65536,
+                 branch='fixed'):
+    step = (thetaend-thetastart)/float(max(numsteps-1,1))
+    state = {}
+    for start in range(0,numsteps,chunksize):
+        index = np.arange(start,min(start+chunksize,numsteps))
+        thetas = thetastart + index*step
+        if index[-1] == numsteps-1 and numsteps > 1:
+            thetas[-1] = thetaend
+        joints, valid = solve_plan(plan,thetas,branch,state=state)
+        yield start, thetas, joints, valid
+
+# Pass every chunk from solve_chunks() to each consumer, a callable
+# taking (start, thetas, joints, valid), e.g. a ColumnWriter from
+# TrajectoryIO.py. Consumers with a close() method are closed at
+# the end. Returns the total number of steps.
+def consume(chunks,*consumers):
+    numsteps = 0
+    try:
+        for start, thetas, joints, valid in chunks:
+            for consumer in consumers:
+                consumer(start,thetas,joints,valid)
+            numsteps = start+thetas.shape[0]
+    finally:
+        for consumer in consumers:
+            if hasattr(consumer,'close'):
+                consumer.close()
+    return numsteps
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+The example linkages of this directory written as Mechanism
+descriptions (see Mechanism.py), built from the same initial joint
+files and link lengths as the scripts:
+* fourbar(): CircCirc4Bar.py, from InitialJoints4Bar.txt
+* geared5bar(): Geared5Bar.py, from InitialJointsGeared5Bar.txt
+* klann(): Klann-ish.py, from InitialJointsKlann.txt
+* jansenlite(): Jansen-lite.py, from the link lengths of the report
+* findassembly(): Which circcirc() solution matches a given joint.
+* scriptthetas(): The input angles each script rotates through.
+* buildexample(): One of the examples by name, from its joint file.
+* solveexample(): Build and solve an example through the trajectory
+  cache (see TrajectoryCache.py), so repeated runs load the arrays.
+Joint names follow the scripts, so e.g.
+    joints, valid = solve(klann(np.loadtxt('InitialJointsKlann.txt')),
+                          scriptthetas('klann'))
+gives joints['joint36'] and joints['foot'] as in Klann-ish.py.
+"""
+
+import os
+import numpy as np
+
+from LinkageUtilities import circcirc, polar
+from Mechanism import Mechanism, compile_mechanism
+from TrajectoryCache import cachedsolve
+from Profiling import stage as profilestage
+
+#Initial joint file of each example, next to this module
+EXAMPLEFILES = {'fourbar':'InitialJoints4Bar.txt',
+                'geared5bar':'InitialJointsGeared5Bar.txt',
+                'klann':'InitialJointsKlann.txt',
+                'jansenlite':None}
+
+#########################
+# Use circcirc() to see which solution for the joint at distance
+# r1 from point1 and r2 from point2 matches the joint we've started
+# with. This determines which 'assembly' we have.
+def findassembly(point1,r1,point2,r2,joint):
+    intersections = circcirc(np.asarray(point1,float),r1,
+                             np.asarray(point2,float),r2)
+    if(np.allclose(intersections[0,:],joint)):
+        return 0
+    elif(np.allclose(intersections[1,:],joint)):
+        return 1
+    raise ValueError('neither circcirc() solution matches joint %s' % (joint,))
+
+#########################
+# pointsdata as in InitialJoints4Bar.txt: four joints in order
+# (input pivot first) followed by the coupler point on link3.
+def fourbar(pointsdata):
+    initjoints = pointsdata[0:4,:]
+    initcoupler = pointsdata[4,:]
+    theta2, l2 = polar(initjoints[0,:],initjoints[1,:])
+    gamma1, l3 = polar(initjoints[1,:],initjoints[2,:])
+    _, l4 = polar(initjoints[2,:],initjoints[3,:])
+    gamma2, lc = polar(initjoints[1,:],initcoupler)
+    gammac = -gamma1+gamma2
+
+    mech = Mechanism('fourbar',theta0=theta2)
+    mech.ground('joint12',initjoints[0,:])
+    mech.ground('joint14',initjoints[3,:])
+    mech.crank('joint23','joint12',l2)
+    mech.dyad('joint34','joint23',l3,'joint14',l4,
+              findassembly(initjoints[1,:],l3,initjoints[3,:],l4,initjoints[2,:]))
+    mech.coupler('coupler','joint34','joint23',lc,np.pi+gammac)
+    return mech
+
+#########################
+# pointsdata as in InitialJointsGeared5Bar.txt: five joints starting
+# with the input pivot and working around the loop, followed by the
+# coupler point on link4. gearratio is input gear rotations per
+# output rotation, as in Geared5Bar.py.
+def geared5bar(pointsdata,gearratio=-2.0):
+    initjoints = pointsdata[0:5,:]
+    initcoupler = pointsdata[5,:]
+    theta2start, l2 = polar(initjoints[0,:],initjoints[1,:])
+    _, l3 = polar(initjoints[1,:],initjoints[2,:])
+    gamma1, l4 = polar(initjoints[3,:],initjoints[2,:])
+    theta5start, l5 = polar(initjoints[4,:],initjoints[3,:])
+    gamma2, lc = polar(initjoints[2,:],initcoupler)
+    gammac = gamma2-gamma1
+
+    mech = Mechanism('geared5bar',theta0=theta2start)
+    mech.ground('joint12',initjoints[0,:])
+    mech.ground('joint15',initjoints[4,:])
+    mech.crank('joint23','joint12',l2)
+    mech.gear('joint45','joint15',l5,'joint23',gearratio,theta5start,theta2start)
+    mech.dyad('joint34','joint23',l3,'joint45',l4,
+              findassembly(initjoints[1,:],l3,initjoints[3,:],l4,initjoints[2,:]))
+    mech.coupler('coupler','joint45','joint34',lc,gammac)
+    return mech
+
+#########################
+# pointsdata as in InitialJointsKlann.txt: the three fixed points
+# joint12, joint14, joint15, then joint23, joint34, joint36, joint56
+# and the foot. See KlannNotation.png for the numbering.
+def klann(pointsdata):
+    joint12, joint14, joint15 = pointsdata[0,:], pointsdata[1,:], pointsdata[2,:]
+    joint23, joint34, joint36 = pointsdata[3,:], pointsdata[4,:], pointsdata[5,:]
+    joint56, foot = pointsdata[6,:], pointsdata[7,:]
+    theta2, l2 = polar(joint12,joint23)
+    gamma1, l3 = polar(joint23,joint34)
+    gamma2, c3 = polar(joint34,joint36)
+    gamma3 = gamma2-gamma1
+    _, l4 = polar(joint14,joint34)
+    _, l5 = polar(joint15,joint56)
+    gamma1, l6 = polar(joint56,joint36)
+    gamma2, c5 = polar(joint36,foot)
+    gamma5 = gamma2-gamma1
+
+    mech = Mechanism('klann',theta0=theta2)
+    mech.ground('joint12',joint12)
+    mech.ground('joint14',joint14)
+    mech.ground('joint15',joint15)
+    mech.crank('joint23','joint12',l2)
+    mech.dyad('joint34','joint23',l3,'joint14',l4,
+              findassembly(joint23,l3,joint14,l4,joint34))
+    mech.coupler('joint36','joint23','joint34',c3,gamma3)
+    mech.dyad('joint56','joint36',l6,'joint15',l5,
+              findassembly(joint36,l6,joint15,l5,joint56))
+    mech.coupler('foot','joint56','joint36',c5,gamma5)
+    return mech
+
+#########################
+# Jansen-lite linkage with the link lengths of Fig. 5.4.3 of the
+# report cited in Jansen-lite.py. joint4 and joint3 are the two
+# solutions of the same pair of circles.
+def jansenlite(linka=26.,linke=56.,linkd=77.,linkf=75.,link1=53.,
+               alpha1=0.085,gammad=-(np.pi-2.97)):
+    mech = Mechanism('jansenlite',theta0=1.4)
+    mech.ground('fp1',(0.0,0.0))
+    mech.ground('fp2',-link1*np.array([np.cos(alpha1),np.sin(alpha1)]))
+    mech.crank('crank','fp1',linka)
+    mech.dyad('joint4','crank',linke,'fp2',linkd,0)
+    mech.dyad('joint3','crank',linke,'fp2',linkd,1)
+    mech.coupler('joint5','joint3','fp2',linkd,gammad)
+    mech.dyad('foot','joint5',linkf,'joint4',linkf,1)
+    return mech
+
+#########################
+# The input angles each example script rotates through.
+# The geared five-bar starts from its initial configuration,
+# so give its theta0 (mech.theta0 of geared5bar()).
+def scriptthetas(name,theta0=0.0):
+    if name == 'fourbar':
+        return np.linspace(0.,1.95*np.pi,20)
+    if name == 'geared5bar':
+        return np.linspace(theta0,theta0-6.0*np.pi,60)
+    if name == 'klann':
+        return np.linspace(0.2,-1.9*np.pi,30)
+    if name == 'jansenlite':
+        return np.linspace(1.4,1.4+1.95*np.pi,50)
+    raise ValueError('unknown example: %r' % (name,))
+
+#########################
+# Build an example by name ('fourbar', 'geared5bar', 'klann' or
+# 'jansenlite') from filename, which defaults to the example's own
+# initial joints file in this directory. gearratio is only used
+# by 'geared5bar' (default -2 as in Geared5Bar.py).
+def buildexample(name,filename=None,gearratio=-2.0):
+    if name not in EXAMPLEFILES:
+        raise ValueError('unknown example: %r' % (name,))
+    if name == 'jansenlite':
+        return jansenlite()
+    if filename is None:
+        filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                EXAMPLEFILES[name])
+    with profilestage('loadtxt'):
+        pointsdata = np.loadtxt(filename)
+    with profilestage('build '+name):
+        if name == 'fourbar':
+            return fourbar(pointsdata)
+        if name == 'geared5bar':
+            return geared5bar(pointsdata,gearratio)
+        return klann(pointsdata)
+
+# Build and solve an example, for the script's input angles unless
+# thetas is given. cache is as for cachedsolve().
+# Returns mech, thetas, joints, valid.
+def solveexample(name,filename=None,thetas=None,branch='fixed',cache=None):
+    mech = buildexample(name,filename)
+    if thetas is None:
+        thetas = scriptthetas(name,mech.theta0)
+    joints, valid = cachedsolve(compile_mechanism(mech),thetas,branch,cache)
+    return mech, thetas, joints, valid
@@ -6,6 +6,9 @@ from numpy import *
 from matplotlib.pyplot import *
 import os
 
+#Draw all the link snapshots with one LineCollection
+from LinkageRender import drawlinks
+
 #See Week 7 2014 class notes for definitions.
 #R2 is the length in the input (crank) link
 #(px,py) are the coordinates of the pin in the slot
@@ -26,8 +29,6 @@ numsteps = 24
 
 #array of input crank angles
 theta2s = linspace(theta2start,theta2end,numsteps)
-xca1 = zeros(numsteps,float)          #arrays for the coupler outputs
-yca1 = zeros(numsteps,float)
 
 #Clear figure
 clf()
@@ -45,42 +46,37 @@ axes().set_aspect('equal', 'datalim')  #square and limited by data
 
 
 ################################
-#Main loop for each crank angle
-#numpy counts from zero, not one
-for i in range(0,numsteps):
-
-    cosq2 = cos(theta2s[i])
-    sinq2 = sin(theta2s[i])
-    
-    loopy = py - R2*sinq2
-    loopx = px - R2*cosq2
-    q3 = arctan2(loopy,loopx)
-
-    
-    #Compute locations of joints 2,3
-    X2 = R2 * cosq2
-    Y2 = R2 * sinq2
-#   X3 = X2+R3*cosq3
-#   Y3 = Y2+R3*sinq3
-    
-    #Now plot the linkage... 
-    #plot every 2nd step to make less messy 
-    if i%2==0:
-        plot([X1,X2],[Y1,Y2],color = 'g') 
-        plot([X2,px],[Y2,py],color = 'r')
-  #     plot([X3,X4],[Y3,Y4],color = 'b')
-    
-    #Coupler location 
-    xca1[i] = R2*cos(theta2s[i])+R5*cos(q3+gammac)
-    yca1[i] = R2*sin(theta2s[i])+R5*sin(q3+gammac)
-    
-    #Plot Coupler
-    plot(xca1[i],yca1[i],'*')
-    if i%2==0:
-        plot([px,xca1[i]],[py,yca1[i]],color='r')
-
-    
-#end for i loop
+#Solve for all crank angles at once: each variable below
+#is an array with one entry per crank angle.
+cosq2 = cos(theta2s)
+sinq2 = sin(theta2s)
+
+loopy = py - R2*sinq2
+loopx = px - R2*cosq2
+q3 = arctan2(loopy,loopx)
+
+
+#Compute locations of joint 2
+X2 = R2 * cosq2
+Y2 = R2 * sinq2
+
+#Coupler location 
+xca1 = R2*cos(theta2s)+R5*cos(q3+gammac)
+yca1 = R2*sin(theta2s)+R5*sin(q3+gammac)
+
+#Now plot the linkage... 
+#plot every 2nd step to make less messy 
+joints = {'1':column_stack((full(numsteps,X1),full(numsteps,Y1))),
+          '2':column_stack((X2,Y2)),
+          'p':column_stack((full(numsteps,px),full(numsteps,py))),
+          'c':column_stack((xca1,yca1))}
+drawlinks(gca(),joints,[('1','2'),('2','p'),('p','c')],
+          every=2,colors=['g','r','r'])
+
+#Plot Coupler
+plot(xca1,yca1,'*')
+
+#end of solution for all crank angles
 
 
 #Open file for writing the coupler points as X Y values with
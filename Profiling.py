@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Optional per-stage timing of the solve pipeline.
+The solver, loaders, writers and renderer wrap their work in
+stage() blocks named like 'loadtxt', 'crank joint23', 'dyad joint34',
+'coupler foot', 'savetxt' or 'savefig'. Nothing is recorded unless
+profiling is switched on, and then each stage collects its call
+count, total time and total array size (number of steps or designs),
+and can also be sent to a callback as it finishes.
+When profiling is off, stage() returns a shared do-nothing context,
+so the cost is one function call per stage (not per step).
+Stages run in pool workers (as by sweep() in Geared5BarSweep.py)
+are recorded by a Profiler in each worker: run the work through
+profiledcall() and merge() the stages it returns into the caller's
+Profiler.
+Contents:
+* Profiler: Collects the stage timings; report() formats them.
+* enable(), disable(), getprofiler(): Switch profiling on and off.
+* profiling(): Context manager: profile only the enclosed code.
+* stage(): Context manager timing one named stage.
+* profiledcall(): Call a function under its own Profiler and return
+  its stages too, for pool workers.
+
+Example:
+    with profiling() as profiler:
+        mech, thetas, joints, valid = solveexample('klann',cache=False)
+    print(profiler.report())
+"""
+
+import time
+from contextlib import contextmanager
+
+_profiler = None
+
+#########################
+# Stage timings by name. callback, if given, is called as
+#   callback(name, seconds, size)
+# each time a stage finishes.
+class Profiler(object):
+
+    def __init__(self,callback=None):
+        self.callback = callback
+        self.stages = {}        #name -> [calls, seconds, size]
+
+    def record(self,name,seconds,size=0):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = [0,0.0,0]
+        entry[0] += 1
+        entry[1] += seconds
+        entry[2] += size
+        if self.callback is not None:
+            self.callback(name,seconds,size)
+
+    # Add the stages of another Profiler (e.g. from a pool worker)
+    def merge(self,stages):
+        for name, (calls, seconds, size) in stages.items():
+            entry = self.stages.get(name)
+            if entry is None:
+                entry = self.stages[name] = [0,0.0,0]
+            entry[0] += calls
+            entry[1] += seconds
+            entry[2] += size
+            if self.callback is not None:
+                self.callback(name,seconds,size)
+
+    def clear(self):
+        self.stages = {}
+
+    # Total time over all stages
+    def total(self):
+        return sum(entry[1] for entry in self.stages.values())
+
+    # Table of the stages, slowest first
+    def report(self):
+        total = self.total() or 1.0
+        lines = ['%-28s %8s %12s %7s %12s'
+                 % ('stage','calls','seconds','%','size')]
+        for name, (calls, seconds, size) in sorted(
+                self.stages.items(),key=lambda item: -item[1][1]):
+            lines.append('%-28s %8d %12.6f %7.1f %12d'
+                         % (name,calls,seconds,100.0*seconds/total,size))
+        return '\n'.join(lines)
+
+#########################
+# Start collecting stage timings into a new Profiler (returned)
+def enable(callback=None):
+    global _profiler
+    _profiler = Profiler(callback)
+    return _profiler
+
+# Stop collecting; returns the Profiler that was active, if any
+def disable():
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+def getprofiler():
+    return _profiler
+
+# Profile the enclosed block only, restoring whatever was active
+@contextmanager
+def profiling(callback=None):
+    global _profiler
+    previous = _profiler
+    profiler = enable(callback)
+    try:
+        yield profiler
+    finally:
+        _profiler = previous
+
+#########################
+class _Stage(object):
+    __slots__ = ('profiler','name','size','tstart')
+
+    def __init__(self,profiler,name,size):
+        self.profiler = profiler
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self.tstart = time.perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        self.profiler.record(self.name,time.perf_counter()-self.tstart,
+                             self.size)
+        return False
+
+class _NoStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        return False
+
+_NOSTAGE = _NoStage()
+
+# Time the enclosed block as the stage name, of size elements:
+#   with stage('dyad joint34',numsteps):
+#       ...
+def stage(name,size=0):
+    if _profiler is None:
+        return _NOSTAGE
+    return _Stage(_profiler,name,size)
+
+# Call function(*args,**kwargs), under a new Profiler if profile is
+# true. Returns (result, stages): the Profiler's stages, for merge()
+# into the caller's Profiler, or None. For work in pool workers,
+# whose own profiling the caller can't see.
+def profiledcall(profile,function,*args,**kwargs):
+    if not profile:
+        return function(*args,**kwargs), None
+    with profiling() as profiler:
+        result = function(*args,**kwargs)
+    return result, profiler.stages
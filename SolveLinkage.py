@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line solver: solve one of the example mechanisms from an
+initial joints file and write the joint arrays, without running
+(or importing) any of the plotting scripts.
+Only NumPy is imported unless a plot is asked for, so batch jobs
+that launch many short solves start quickly.
+
+Usage:
+  python SolveLinkage.py klann InitialJointsKlann.txt -o KlannRun
+  python SolveLinkage.py geared5bar --gearratio 3 --numsteps 100000 \\
+      --thetarange -12.566 -o Geared5BarRun.npz --plot Geared5Bar.png
+mechanism is one of fourbar, geared5bar, klann, jansenlite (the
+joints file defaults to the example's own InitialJoints*.txt), or a
+.linkage2 file from the Linkage program (see Linkage2Import.py).
+Without --numsteps and the angle options the script's own input
+angles are used, or for a .linkage2 file 60 steps over one period
+of the mechanism (see inputperiod()). The output format follows the name: .npz, .txt
+(the scripts' text table) or otherwise a directory of .npy columns
+(see TrajectoryIO.py). Long runs with a directory output are solved
+and written in chunks of --chunksize steps.
+--profile prints the time spent in each stage (loading, each joint,
+writing, plotting; see Profiling.py).
+"""
+
+import sys
+import argparse
+import numpy as np
+
+from Mechanism import compile_mechanism, solve_chunks, consume, inputperiod
+from MechanismExamples import EXAMPLEFILES, buildexample, scriptthetas
+from TrajectoryCache import cachedsolve
+from TrajectoryIO import ColumnWriter, mechanismmetadata, savetrajectory
+from Linkage2Import import loadlinkage2
+import Profiling
+
+#########################
+def parsearguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Solve a linkage from an initial joints file and '
+                    'write the joint trajectories.')
+    parser.add_argument('mechanism',
+                        help='%s or a .linkage2 file' % ', '.join(sorted(EXAMPLEFILES)))
+    parser.add_argument('jointsfile',nargs='?',default=None,
+                        help='initial joints file (default: the example\'s own)')
+    parser.add_argument('-o','--output',default=None,
+                        help='.npz, .txt or directory of .npy columns')
+    parser.add_argument('--thetastart',type=float,default=None,
+                        help='first input angle (default: initial configuration)')
+    parser.add_argument('--thetarange',type=float,default=None,
+                        help='input rotation, may be negative (default 2*pi)')
+    parser.add_argument('--numsteps',type=int,default=None)
+    parser.add_argument('--gearratio',type=float,default=-2.0,
+                        help='geared5bar: input gear rotations per output rotation')
+    parser.add_argument('--branch',choices=('fixed','track'),default='fixed')
+    parser.add_argument('--chunksize',type=int,default=1000000)
+    parser.add_argument('--no-cache',dest='cache',action='store_false',
+                        help='do not use the trajectory cache')
+    parser.add_argument('--plot',default=None,
+                        help='also draw the linkage to this PDF/PNG file')
+    parser.add_argument('--profile',action='store_true',
+                        help='print the time spent in each solve stage')
+    args = parser.parse_args(argv)
+    if (args.mechanism not in EXAMPLEFILES
+            and not args.mechanism.lower().endswith('.linkage2')):
+        parser.error('unknown mechanism %r' % args.mechanism)
+    return args
+
+#########################
+def main(argv=None):
+    args = parsearguments(argv)
+    if not args.profile:
+        return run(args)
+    with Profiling.profiling() as profiler:
+        status = run(args)
+    print(profiler.report())
+    return status
+
+def run(args):
+    linkage2 = args.mechanism not in EXAMPLEFILES
+    if linkage2:
+        mech = loadlinkage2(args.mechanism)
+    else:
+        mech = buildexample(args.mechanism,args.jointsfile,args.gearratio)
+    plan = compile_mechanism(mech)
+
+    if (args.numsteps is None and args.thetastart is None
+            and args.thetarange is None and not linkage2):
+        thetas = scriptthetas(args.mechanism,mech.theta0)
+    else:
+        thetastart = mech.theta0 if args.thetastart is None else args.thetastart
+        thetarange = args.thetarange
+        if thetarange is None:
+            thetarange = (inputperiod(plan) or 2*np.pi) if linkage2 else 2*np.pi
+        numsteps = args.numsteps or 60
+        thetas = None
+    metadata = mechanismmetadata(mech)
+
+    chunked = (thetas is None and numsteps > args.chunksize
+               and args.output is not None
+               and not args.output.lower().endswith(('.npz','.txt','.csv')))
+    if chunked:
+        #Long run straight to disk, never holding it all in memory
+        writer = ColumnWriter(args.output,numsteps,metadata)
+        consume(solve_chunks(plan,thetastart,thetastart+thetarange,
+                             numsteps,args.chunksize,args.branch),writer)
+        print('%d steps written to %s' % (numsteps,args.output))
+        if args.plot:
+            print('--plot is not available for chunked runs')
+        return 0
+
+    if thetas is None:
+        thetas = np.linspace(thetastart,thetastart+thetarange,numsteps)
+    joints, valid = cachedsolve(plan,thetas,args.branch,
+                                None if args.cache else False)
+    if not valid.all():
+        print('Linkage cannot be assembled at %d of %d steps'
+              % (np.sum(~valid),valid.shape[0]))
+    if args.output is not None:
+        columns = dict(joints,thetas=thetas,valid=valid)
+        savetrajectory(args.output,columns,metadata,
+                       [stage[1] for stage in plan if stage[0] != 'ground'])
+        print('%d steps written to %s' % (thetas.shape[0],args.output))
+    if args.plot:
+        #Only now pay for importing matplotlib
+        from LinkageRender import planlinks, renderlinkage
+        renderlinkage(args.plot,joints,planlinks(plan),title=mech.name)
+        print('Plot written to %s' % args.plot)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of solved trajectories, so the same mechanism solved
+again (in another notebook, batch job or sweep) is loaded instead of
+recomputed.
+Entries are keyed by a hash of everything that determines the
+result: the compiled plan (link lengths, angles, assemblies...),
+the exact input angles, the solver options and the kernel backend
+(see KinematicKernels.py). Each entry is one uncompressed .npz file
+of the joint arrays. When the directory grows past maxbytes, the
+least recently used entries are deleted down to HEADROOM of it
+(checked every EVICTEVERY saves, or sooner once the entries this
+cache saved would pass maxbytes).
+Used by default by the example scripts, solveexample() in
+MechanismExamples.py and sweep() in Geared5BarSweep.py.
+Contents:
+* cachekey(): Hash a plan, input angles and options.
+* TrajectoryCache: The cache directory, with load(), save(), evict()
+  and clear().
+* getcache(): Turn a cache argument (None, True, False, a directory or a
+  TrajectoryCache) into a TrajectoryCache or None.
+* cachedsolve(): solve_plan() through the cache.
+
+The default directory is ~/.cache/linkage-trajectories, or the
+LINKAGE_CACHE environment variable if set. Set LINKAGE_CACHE=off to
+disable caching everywhere.
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+import numpy as np
+
+from Mechanism import solve_plan
+from KinematicKernels import get_backend
+from Profiling import stage as profilestage
+
+CACHEVERSION = 1
+DEFAULTMAXBYTES = 512*1024*1024
+EVICTEVERY = 64         #saves between checks of the directory size
+STALETMP = 3600.0       #seconds after which a .tmp file is abandoned
+HEADROOM = 0.9          #fraction of maxbytes left after eviction
+
+#########################
+# Hash of a plan (from compile_mechanism()), the input angles and
+# any solver options given as keywords. Floats in the plan are
+# hashed through repr(), which is exact; array options are hashed
+# by their contents.
+def cachekey(plan,thetas,**options):
+    h = hashlib.sha256()
+    h.update(repr((CACHEVERSION,plan)).encode())
+    _hasharray(h,np.asarray(thetas,float))
+    for name in sorted(options):
+        h.update(repr(name).encode())
+        if isinstance(options[name],np.ndarray):
+            _hasharray(h,options[name])
+        else:
+            h.update(repr(options[name]).encode())
+    return h.hexdigest()
+
+def _hasharray(h,array):
+    array = np.ascontiguousarray(array)
+    h.update(repr((array.dtype.str,array.shape)).encode())
+    h.update(array.tobytes())
+
+#########################
+class TrajectoryCache(object):
+
+    def __init__(self,directory=None,maxbytes=DEFAULTMAXBYTES):
+        if directory is None:
+            directory = os.environ.get('LINKAGE_CACHE',
+                os.path.join(os.path.expanduser('~'),'.cache',
+                             'linkage-trajectories'))
+        self.directory = directory
+        self.maxbytes = maxbytes
+        self._total = None      #size at the last evict(), plus saves since
+        self._saves = 0
+
+    def path(self,key):
+        return os.path.join(self.directory,key+'.npz')
+
+    # dict of the arrays saved under key, or None if not cached.
+    # A hit marks the entry as recently used.
+    def load(self,key):
+        filename = self.path(key)
+        try:
+            with np.load(filename) as data:
+                arrays = dict((name,data[name]) for name in data.files)
+            os.utime(filename,None)
+        except (IOError,OSError,ValueError):
+            return None
+        return arrays
+
+    # Save a dict of arrays under key, then evict old entries if
+    # due. Written to a temporary file first, so parallel workers
+    # never see half-written entries.
+    def save(self,key,arrays):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        handle, tmpname = tempfile.mkstemp(suffix='.tmp',dir=self.directory)
+        try:
+            with os.fdopen(handle,'wb') as f:
+                np.savez(f,**arrays)
+            size = os.path.getsize(tmpname)
+            os.replace(tmpname,self.path(key))
+        except Exception:
+            os.remove(tmpname)
+            raise
+        self._saves += 1
+        if self._total is not None:
+            self._total += size
+        if (self._total is None or self._total > self.maxbytes
+                or self._saves >= EVICTEVERY):
+            self.evict()
+
+    # If the total size of the cache is over maxbytes, delete least
+    # recently used entries until it is at most HEADROOM*maxbytes.
+    # Also deletes .tmp files left by writes interrupted more than
+    # STALETMP seconds ago.
+    def evict(self):
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                filename = os.path.join(self.directory,name)
+                try:
+                    if now - os.stat(filename).st_mtime > STALETMP:
+                        os.remove(filename)
+                except OSError:
+                    pass
+            elif name.endswith('.npz'):
+                try:
+                    st = os.stat(os.path.join(self.directory,name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime,st.st_size,name))
+        total = sum(entry[1] for entry in entries)
+        target = self.maxbytes
+        if total > self.maxbytes:
+            target = HEADROOM*self.maxbytes
+        for mtime, size, name in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(os.path.join(self.directory,name))
+            except OSError:
+                pass
+            total -= size
+        self._total = total
+        self._saves = 0
+
+    # Delete every entry and .tmp file
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz') or name.endswith('.tmp'):
+                try:
+                    os.remove(os.path.join(self.directory,name))
+                except OSError:
+                    pass
+        self._total = 0
+        self._saves = 0
+
+#########################
+# Interpret the cache argument taken by the solve functions:
+# None or True means the default cache (unless LINKAGE_CACHE=off),
+# False means no caching, a string is a cache directory.
+def getcache(cache=None):
+    if cache is None or cache is True:
+        if os.environ.get('LINKAGE_CACHE','').lower() == 'off':
+            return None
+        return TrajectoryCache()
+    if cache is False:
+        return None
+    if isinstance(cache,str):
+        return TrajectoryCache(cache)
+    return cache
+
+#########################
+# solve_plan() through the cache. Returns joints and valid like
+# solve_plan(); on a hit they are loaded instead of solved.
+def cachedsolve(plan,thetas,branch='fixed',cache=None):
+    cache = getcache(cache)
+    if cache is None:
+        return solve_plan(plan,thetas,branch)
+    key = cachekey(plan,thetas,branch=branch,backend=get_backend())
+    with profilestage('cache load',np.size(thetas)):
+        arrays = cache.load(key)
+    if arrays is not None:
+        valid = arrays.pop('__valid__')
+        return arrays, valid
+    joints, valid = solve_plan(plan,thetas,branch)
+    arrays = dict(joints)
+    arrays['__valid__'] = valid
+    with profilestage('cache save',np.size(thetas)):
+        cache.save(key,arrays)
+    return joints, valid
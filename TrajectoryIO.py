@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Writing and reading solved trajectories as binary columns.
+The scripts write '%4.2f' text tables (Geared5BarOutput.txt,
+KlannPlotPoints.txt, ...), which are slow for large runs, round
+everything to 0.01 and have to be parsed again. Here each named
+column (joint23, joint34, coupler, foot, thetas...) keeps full
+precision:
+* savecolumns(): A directory with one .npy file per column plus
+  metadata.json. Single columns can then be memory-mapped without
+  reading the rest of the table.
+* savenpz(): All columns in one .npz file, with the metadata.
+* savetext(): The scripts' tab-delimited text table, for Excel and
+  Matlab users.
+* savetrajectory(): Pick one of the above from the file name.
+* ColumnWriter: Write chunks from solve_chunks() straight into a
+  savecolumns() directory, without holding the whole run in memory.
+* loadcolumn(), loadcolumns(), loadmetadata(): Read them back.
+* mechanismmetadata(): Describe a Mechanism for the metadata.
+
+Example:
+    mech, thetas, joints, valid = solveexample('klann')
+    columns = dict(joints,thetas=thetas,valid=valid)
+    savecolumns('KlannRun',columns,mechanismmetadata(mech))
+    foot = loadcolumn('KlannRun','foot')   #memory-mapped, Nx2
+"""
+
+import os
+import json
+import numpy as np
+
+from Profiling import stage as profilestage
+
+METADATAFILE = 'metadata.json'
+
+#########################
+# Metadata describing a Mechanism: its name, initial input angle
+# and elements, in a form json can write.
+def mechanismmetadata(mech,**extra):
+    metadata = {'mechanism':mech.name,
+                'theta0':mech.theta0,
+                'elements':[list(element) for element in mech.elements]}
+    metadata.update(extra)
+    return metadata
+
+def _columninfo(columns):
+    return [{'name':name,'shape':list(np.shape(columns[name])),
+             'dtype':np.asarray(columns[name]).dtype.str} for name in columns]
+
+#########################
+# Write each column of the dict columns to directory/<name>.npy,
+# plus directory/metadata.json with the column names, shapes and
+# the given metadata dict.
+def savecolumns(directory,columns,metadata=None):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name in columns:
+        np.save(os.path.join(directory,name+'.npy'),
+                np.ascontiguousarray(columns[name]))
+    info = {'columns':_columninfo(columns),'metadata':metadata or {}}
+    with open(os.path.join(directory,METADATAFILE),'w') as f:
+        json.dump(info,f,indent=1)
+
+# All columns in one (uncompressed) .npz file, with the metadata as
+# a JSON string in the entry '__metadata__'.
+def savenpz(filename,columns,metadata=None):
+    arrays = dict((name,np.ascontiguousarray(columns[name])) for name in columns)
+    info = {'columns':_columninfo(columns),'metadata':metadata or {}}
+    arrays['__metadata__'] = np.array(json.dumps(info))
+    np.savez(filename,**arrays)
+
+# Tab-delimited text table as written by the scripts, one row per
+# step and x,y columns per joint, with a header naming the joints.
+# names picks and orders the columns (default: all 2-D ones).
+def savetext(filename,columns,names=None,fmt='%4.2f'):
+    if names is None:
+        names = [name for name in columns if np.ndim(columns[name]) == 2]
+    table = np.column_stack([columns[name] for name in names])
+    headerstring = ', '.join(name+('(x,y)' if np.ndim(columns[name]) == 2
+                                   else '') for name in names)
+    np.savetxt(filename,table,header=headerstring,delimiter='\t',
+               newline='\n',fmt=fmt)
+
+# Write with savenpz() for '.npz', savetext() for '.txt' or '.csv',
+# otherwise savecolumns() into a directory of that name.
+def savetrajectory(filename,columns,metadata=None,names=None):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.npz':
+        with profilestage('savenpz'):
+            savenpz(filename,columns,metadata)
+    elif extension in ('.txt','.csv'):
+        with profilestage('savetxt'):
+            savetext(filename,columns,names)
+    else:
+        with profilestage('savecolumns'):
+            savecolumns(filename,columns,metadata)
+
+#########################
+# Consumer for solve_chunks()/consume() that writes each chunk into
+# a savecolumns() directory for a run of numsteps steps. The .npy
+# files are created full size and filled in through memory maps,
+# with columns thetas, valid and one Nx2 column per joint (or only
+# the joints in names).
+class ColumnWriter(object):
+
+    def __init__(self,directory,numsteps,metadata=None,names=None):
+        self.directory = directory
+        self.numsteps = numsteps
+        self.metadata = metadata
+        self.names = names
+        self.columns = None
+
+    def __call__(self,start,thetas,joints,valid):
+        chunk = {'thetas':thetas,'valid':valid}
+        for name in (self.names or joints):
+            chunk[name] = joints[name]
+        if self.columns is None:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self.columns = {}
+            for name in chunk:
+                array = np.asarray(chunk[name])
+                self.columns[name] = np.lib.format.open_memmap(
+                    os.path.join(self.directory,name+'.npy'),mode='w+',
+                    dtype=array.dtype,shape=(self.numsteps,)+array.shape[1:])
+        stop = start+thetas.shape[0]
+        with profilestage('write columns',thetas.shape[0]):
+            for name in chunk:
+                self.columns[name][start:stop] = chunk[name]
+
+    def close(self):
+        if self.columns is None:
+            return
+        info = {'columns':_columninfo(self.columns),
+                'metadata':self.metadata or {}}
+        for name in self.columns:
+            self.columns[name].flush()
+        self.columns = None
+        with open(os.path.join(self.directory,METADATAFILE),'w') as f:
+            json.dump(info,f,indent=1)
+
+#########################
+# One column of a savecolumns() directory or savenpz() file.
+# From a directory the column is memory-mapped (read-only) unless
+# mmap is False, so only the parts used are read from disk.
+def loadcolumn(filename,name,mmap=True):
+    if os.path.isdir(filename):
+        return np.load(os.path.join(filename,name+'.npy'),
+                       mmap_mode='r' if mmap else None)
+    with np.load(filename) as data:
+        return data[name]
+
+# dict of the named columns (default all) of a saved trajectory
+def loadcolumns(filename,names=None,mmap=True):
+    if names is None:
+        names = [column['name'] for column in _loadinfo(filename)['columns']]
+    return dict((name,loadcolumn(filename,name,mmap)) for name in names)
+
+# The metadata dict saved with a trajectory
+def loadmetadata(filename):
+    return _loadinfo(filename)['metadata']
+
+def _loadinfo(filename):
+    if os.path.isdir(filename):
+        with open(os.path.join(filename,METADATAFILE)) as f:
+            return json.load(f)
+    with np.load(filename) as data:
+        return json.loads(str(data['__metadata__']))
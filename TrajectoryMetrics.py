@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Summary measures of solved joint paths that can be accumulated
+chunk by chunk from solve_chunks() (see Mechanism.py), so they
+cost constant memory however long the run is.
+Contents:
+* PathMetrics: Consumer keeping, per joint, the bounding box and
+  path length, plus the number of assemblable steps.
+
+Example:
+    metrics = PathMetrics(['foot'])
+    consume(solve_chunks(plan,0.,2*np.pi,10**7),metrics)
+    print(metrics.pathlength['foot'], metrics.bbox['foot'])
+"""
+
+import numpy as np
+
+#########################
+# Callable consumer for consume(). Only steps that can be assembled
+# count towards the bounding boxes and path lengths; the path length
+# includes the segment joining each chunk to the one before it.
+class PathMetrics(object):
+
+    def __init__(self,names=None):
+        self.names = names
+        self.numsteps = 0
+        self.numvalid = 0
+        self.bbox = {}          #name -> [xmin, ymin, xmax, ymax]
+        self.pathlength = {}    #name -> total distance travelled
+        self._last = {}         #name -> last assemblable point
+
+    def __call__(self,start,thetas,joints,valid):
+        self.numsteps += thetas.shape[0]
+        self.numvalid += int(np.sum(valid))
+        if not np.any(valid):
+            return
+        for name in (self.names or joints):
+            points = joints[name][valid]
+            if name in self._last:
+                points = np.vstack((self._last[name],points))
+            lo = points.min(axis=0)
+            hi = points.max(axis=0)
+            if name in self.bbox:
+                lo = np.minimum(lo,self.bbox[name][:2])
+                hi = np.maximum(hi,self.bbox[name][2:])
+            self.bbox[name] = np.concatenate((lo,hi))
+            steps = np.diff(points,axis=0)
+            self.pathlength[name] = (self.pathlength.get(name,0.0)
+                                     + np.sum(np.hypot(steps[:,0],steps[:,1])))
+            self._last[name] = points[-1:]